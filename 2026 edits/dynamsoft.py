@@ -84,6 +84,17 @@ class DynamsoftBarcodeReader:
             logger.error(f"Unexpected error decoding {img_path}: {e}", exc_info=True)
         return wrapped_results
 
+    def decode_bytes(self, data, name="<inline>"):
+        """Decode a barcode from encoded image bytes (JPEG/PNG) already in memory."""
+        wrapped_results = []
+        try:
+            self.wrap_results(wrapped_results, [self.cvr.capture(data, "")])
+        except (RuntimeError, AttributeError) as e:
+            logger.error(f"Error decoding {name}: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error decoding {name}: {e}", exc_info=True)
+        return wrapped_results
+
     # -----------------------
     # Wrap results for ROI & format
     # -----------------------
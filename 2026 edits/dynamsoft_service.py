@@ -0,0 +1,543 @@
+import os
+import sys
+import json
+import time
+import uuid
+import heapq
+import base64
+import struct
+import argparse
+import logging
+import threading
+import socketserver
+from enum import IntEnum
+from typing import Dict, Any, List, Optional
+
+from dynamsoft import DynamsoftBarcodeReader
+
+logger = logging.getLogger(__name__)
+
+
+class TaskState(IntEnum):
+    Pending = 0
+    Processing = 1
+    Completed = 2
+
+
+class Priority(IntEnum):
+    Live = 0        # a linker/checker cycle waiting on this read
+    Retry = 1       # operator or automatic re-decode
+    Bulk = 2        # backlog jobs (failed_links re-decoding)
+
+
+# Deadline applied when the client does not send DeadlineMs (None = no deadline)
+DEFAULT_DEADLINE_MS = {Priority.Live: 30000, Priority.Retry: 60000, Priority.Bulk: None}
+
+
+def parse_priority(value) -> Priority:
+    """Accept "live" / "retry" / "bulk" or the numeric value; default Live, as older clients are live cycles."""
+    if value is None:
+        return Priority.Live
+    if isinstance(value, str):
+        return Priority[value.capitalize()]
+    return Priority(int(value))
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+# -----------------------
+# Task
+# -----------------------
+class DecodeTask:
+    """One submitted file, with the timestamps needed for per-task timing."""
+
+    def __init__(self, filename: str, template_path: Optional[str], priority: Priority = Priority.Live,
+                 deadline_ms: Optional[float] = None, image: Optional[bytes] = None):
+        self.task_id = uuid.uuid4().hex
+        self.filename = filename
+        self.image = image          # inline encoded image; filename is then only a label
+        self.template_path = template_path
+        self.priority = priority
+        self.state = TaskState.Pending
+        self.cancelled = False
+        self.expired = False
+        self.queued = False
+        self.results: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.worker: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.last_state_change = self.submitted_at
+        self.deadline = None if deadline_ms is None else time.monotonic() + deadline_ms / 1000.0
+        self.done = threading.Event()
+
+    def past_deadline(self, now: float) -> bool:
+        return self.deadline is not None and now >= self.deadline
+
+    def set_state(self, state: TaskState):
+        self.state = state
+        self.last_state_change = time.time()
+        if state == TaskState.Processing:
+            self.started_at = self.last_state_change
+        elif state == TaskState.Completed:
+            self.finished_at = self.last_state_change
+            self.done.set()
+
+    def timing(self) -> Dict[str, Any]:
+        """Queue wait, decode and total time in milliseconds (None until known)."""
+        def ms(a, b):
+            return None if a is None or b is None else round((b - a) * 1000, 1)
+        return {
+            "QueueMs": ms(self.submitted_at, self.started_at),
+            "DecodeMs": ms(self.started_at, self.finished_at),
+            "TotalMs": ms(self.submitted_at, self.finished_at),
+            "Worker": self.worker,
+            "Priority": self.priority.name,
+        }
+
+    def response(self) -> Dict[str, Any]:
+        """Status reply in the same shape ProcessingServer clients read."""
+        response = {
+            "TaskId": self.task_id,
+            "GenericResult": self.error is None,
+            "State": int(self.state),
+            "LastStateChange": self.last_state_change,
+            "Results": {},
+            "Timing": self.timing(),
+        }
+        if self.state == TaskState.Completed:
+            serials = [r["ID"] for r in self.results] or ["-1"]
+            response["Results"] = {"serials": serials, "barcodes": self.results}
+        if self.cancelled:
+            response["Cancelled"] = True
+        if self.expired:
+            response["Expired"] = True
+        if self.error:
+            response["Error"] = self.error
+        return response
+
+
+# -----------------------
+# Priority queue
+# -----------------------
+class PriorityTaskQueue:
+    """
+    Pending tasks ordered by priority class, then deadline, then arrival. Each class has its own
+    capacity so a bulk backlog can never fill the queue against live cycles. Cancelled tasks are
+    discarded in place (their slot frees at once) and skipped when they reach the head.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._heap = []
+        self._seq = 0
+        self._counts = {p: 0 for p in Priority}
+        self._cond = threading.Condition()
+
+    def put(self, task: DecodeTask):
+        with self._cond:
+            if self._counts[task.priority] >= self.maxsize:
+                raise QueueFullError(f"Decode queue full for {task.priority.name} ({self.maxsize} tasks)")
+            deadline = task.deadline if task.deadline is not None else float("inf")
+            heapq.heappush(self._heap, (int(task.priority), deadline, self._seq, task))
+            self._seq += 1
+            self._counts[task.priority] += 1
+            task.queued = True
+            self._cond.notify_all()
+
+    def discard(self, task: DecodeTask):
+        with self._cond:
+            if task.queued:
+                task.queued = False
+                self._counts[task.priority] -= 1
+
+    def get(self, timeout: float, max_priority: Priority = Priority.Bulk) -> Optional[DecodeTask]:
+        """Highest-priority queued task no lower than max_priority, or None after timeout."""
+        end = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                # Drop entries discarded since they were queued
+                while self._heap and not self._heap[0][3].queued:
+                    heapq.heappop(self._heap)
+                if self._heap and self._heap[0][0] <= max_priority:
+                    task = heapq.heappop(self._heap)[3]
+                    task.queued = False
+                    self._counts[task.priority] -= 1
+                    return task
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def counts(self) -> Dict[str, int]:
+        with self._cond:
+            return {p.name: n for p, n in self._counts.items()}
+
+
+# -----------------------
+# Decode service
+# -----------------------
+class DecodeService:
+    """
+    Long-running decoder: a bounded priority queue drained by N worker threads, each with its own
+    warm DynamsoftBarcodeReader (license and template loaded once, not per request).
+    Dynamsoft releases the GIL while decoding, so worker threads decode in parallel.
+
+    live_reserved workers only ever take Live tasks, so a live cycle never waits behind a bulk
+    decode already in progress. Tasks past their deadline are dropped instead of decoded.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 64, template_path: Optional[str] = None,
+                 keep_completed: int = 1000, live_reserved: int = 1, max_upload_bytes: int = 64 * 1024 * 1024,
+                 upload_timeout: float = 60.0):
+        self.default_template = template_path
+        self.keep_completed = keep_completed
+        self.max_upload_bytes = max_upload_bytes
+        self.upload_timeout = upload_timeout
+        self._uploads: Dict[str, Dict[str, Any]] = {}     # UploadId -> chunks received so far
+        self._queue = PriorityTaskQueue(queue_size)
+        self._tasks: Dict[str, DecodeTask] = {}
+        self._completed: List[str] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self.started_at = time.time()
+        self.decoded = 0
+        self.dropped = 0
+
+        # Load every reader before accepting work so the first task is not slow
+        self._readers = [self._make_reader(template_path) for _ in range(workers)]
+        # Never reserve every worker, or retry and bulk tasks would never run
+        live_reserved = min(live_reserved, workers - 1)
+        for i, reader in enumerate(self._readers):
+            max_priority = Priority.Live if i < live_reserved else Priority.Bulk
+            t = threading.Thread(target=self._worker_loop, args=(f"worker-{i}", reader, max_priority),
+                                 name=f"decode-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"Decode service ready: {workers} worker(s) ({live_reserved} live-only), "
+                    f"queue size {queue_size} per priority")
+
+    @staticmethod
+    def _make_reader(template_path: Optional[str]) -> DynamsoftBarcodeReader:
+        return DynamsoftBarcodeReader(template_path)
+
+    def stop(self):
+        self._stop.set()
+
+    # -----------------------
+    # Task API
+    # -----------------------
+    def submit(self, filename: str, template_path: Optional[str] = None, priority: Priority = Priority.Live,
+               deadline_ms: Optional[float] = None, image: Optional[bytes] = None) -> DecodeTask:
+        if deadline_ms is None:
+            deadline_ms = DEFAULT_DEADLINE_MS[priority]
+        task = DecodeTask(filename, template_path, priority, deadline_ms, image)
+        with self._lock:
+            self._tasks[task.task_id] = task
+        try:
+            self._queue.put(task)
+        except QueueFullError:
+            with self._lock:
+                del self._tasks[task.task_id]
+            raise
+        return task
+
+    def add_chunk(self, values: Dict[str, Any]) -> Optional[DecodeTask]:
+        """
+        Collect one SubmitImageChunk. Chunks must arrive in order; the first carries the Submit values.
+        Returns the queued task on the Final chunk, else None.
+        """
+        upload_id = values.get("UploadId")
+        index = values.get("Index", 0)
+        data = base64.b64decode(values.get("Data", ""))
+        now = time.monotonic()
+        with self._lock:
+            # Forget uploads whose client went away mid-stream
+            for uid in [u for u, up in self._uploads.items() if now - up["updated"] > self.upload_timeout]:
+                del self._uploads[uid]
+            if index == 0:
+                self._uploads[upload_id] = {"values": values, "chunks": [], "size": 0, "updated": now}
+            upload = self._uploads.get(upload_id)
+            if upload is None or index != len(upload["chunks"]):
+                self._uploads.pop(upload_id, None)
+                raise ValueError(f"Upload {upload_id}: unexpected chunk {index}")
+            upload["size"] += len(data)
+            if upload["size"] > self.max_upload_bytes:
+                del self._uploads[upload_id]
+                raise ValueError(f"Upload {upload_id} exceeds {self.max_upload_bytes} bytes")
+            upload["chunks"].append(data)
+            upload["updated"] = now
+            if not values.get("Final"):
+                return None
+            del self._uploads[upload_id]
+
+        first = upload["values"]
+        return self.submit(first.get("FileName"), first.get("TemplatePath"), parse_priority(first.get("Priority")),
+                           first.get("DeadlineMs"), b"".join(upload["chunks"]))
+
+    def get(self, task_id: Optional[str]) -> Optional[DecodeTask]:
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def cancel(self, task_id: Optional[str]) -> Optional[DecodeTask]:
+        """Mark a task cancelled. A pending task completes immediately with no result;
+        one already decoding finishes but is reported as cancelled."""
+        task = self.get(task_id)
+        if task is None:
+            return None
+        # Same lock as the worker's Pending -> Processing step, so a task is either completed here
+        # or decoded by the worker, never both
+        with self._lock:
+            task.cancelled = True
+            if task.state == TaskState.Pending:
+                self._queue.discard(task)
+                self._complete(task)
+        return task
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(1 for t in self._tasks.values() if t.state == TaskState.Pending)
+            processing = sum(1 for t in self._tasks.values() if t.state == TaskState.Processing)
+        return {
+            "Workers": len(self._readers),
+            "Pending": pending,
+            "Processing": processing,
+            "Queued": self._queue.counts(),
+            "Decoded": self.decoded,
+            "Dropped": self.dropped,
+            "UptimeSec": round(time.time() - self.started_at, 1),
+        }
+
+    def _finish(self, task: DecodeTask):
+        with self._lock:
+            self._complete(task)
+
+    def _complete(self, task: DecodeTask):
+        # Caller holds self._lock
+        if task.state == TaskState.Completed:
+            return
+        task.set_state(TaskState.Completed)
+        if task.started_at is not None:
+            self.decoded += 1
+        self._completed.append(task.task_id)
+        # Forget the oldest finished tasks so a long-running service does not grow without bound
+        while len(self._completed) > self.keep_completed:
+            self._tasks.pop(self._completed.pop(0), None)
+
+    # -----------------------
+    # Workers
+    # -----------------------
+    def _worker_loop(self, name: str, reader: DynamsoftBarcodeReader, max_priority: Priority):
+        readers = {reader.template_path: reader}
+        while not self._stop.is_set():
+            task = self._queue.get(0.5, max_priority)
+            if task is None or task.cancelled:
+                continue
+            if task.past_deadline(time.monotonic()):
+                # The client has given up on it; decoding now only delays everything behind it
+                task.expired = True
+                task.error = "Deadline expired before decoding"
+                with self._lock:
+                    self.dropped += 1
+                self._finish(task)
+                logger.info(f"{task.task_id} dropped: deadline expired ({task.priority.name})")
+                continue
+            with self._lock:
+                # Cancelled between dequeue and here
+                if task.cancelled or task.state == TaskState.Completed:
+                    continue
+                task.worker = name
+                task.set_state(TaskState.Processing)
+            try:
+                template = self._resolve_template(task.template_path) or reader.template_path
+                if template not in readers:
+                    readers[template] = self._make_reader(template)
+                if task.image is not None:
+                    task.results = readers[template].decode_bytes(task.image, task.filename)
+                else:
+                    task.results = readers[template].decode_file(task.filename)
+            except Exception as e:
+                logger.error(f"Task {task.task_id} failed: {e}")
+                task.error = str(e)
+            task.image = None
+            self._finish(task)
+            timing = task.timing()
+            logger.info(f"{task.task_id} {os.path.basename(task.filename)}: "
+                        f"{[r['ID'] for r in task.results] or '-1'} queue={timing['QueueMs']}ms "
+                        f"decode={timing['DecodeMs']}ms {task.priority.name} ({name})")
+
+    def _resolve_template(self, template_path: Optional[str]) -> Optional[str]:
+        # Clients send their own (often relative) template path; fall back to the preloaded one
+        if template_path and os.path.exists(template_path):
+            return template_path
+        return None
+
+
+# -----------------------
+# Protocol
+# -----------------------
+class DecodeRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Speaks the ProcessingServer protocol. Framing is detected per message: a leading "{" is JSON text
+    (newline-delimited, or a bare object from one-request-per-connection clients), anything else is
+    a 4-byte big-endian length prefix. The connection stays open until the client closes it.
+    SubmitImage / SubmitImageChunk carry base64 image bytes, so clients need no access to the share.
+    """
+
+    def setup(self):
+        self.buffer = b""
+        self.service: DecodeService = self.server.service
+
+    def _recv_more(self) -> bool:
+        chunk = self.request.recv(65536)
+        if not chunk:
+            return False
+        self.buffer += chunk
+        return True
+
+    def _read_message(self):
+        while not self.buffer:
+            if not self._recv_more():
+                return None, None
+        if self.buffer[:1] != b"{":
+            while len(self.buffer) < 4:
+                if not self._recv_more():
+                    return None, None
+            (length,) = struct.unpack(">I", self.buffer[:4])
+            while len(self.buffer) < 4 + length:
+                if not self._recv_more():
+                    return None, None
+            data, self.buffer = self.buffer[4:4 + length], self.buffer[4 + length:]
+            return data, "length"
+        while True:
+            if b"\n" in self.buffer:
+                line, _, self.buffer = self.buffer.partition(b"\n")
+                return line, "text"
+            try:
+                json.loads(self.buffer.decode("utf-8"))
+                data, self.buffer = self.buffer, b""
+                return data, "text"
+            except ValueError:
+                pass
+            if not self._recv_more():
+                return None, None
+
+    def _send(self, response: Dict[str, Any], framing: str):
+        payload = json.dumps(response).encode("utf-8")
+        if framing == "length":
+            self.request.sendall(struct.pack(">I", len(payload)) + payload)
+        else:
+            self.request.sendall(payload + b"\n")
+
+    def handle(self):
+        while True:
+            try:
+                data, framing = self._read_message()
+            except OSError:
+                return
+            if data is None:
+                return
+            try:
+                response = self.dispatch(json.loads(data.decode("utf-8")))
+            except Exception as e:
+                logger.error(f"Bad request from {self.client_address}: {e}")
+                response = {"GenericResult": False, "Error": str(e)}
+            try:
+                self._send(response, framing)
+            except OSError:
+                return
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        request_type = request.get("RequestType")
+        values = request.get("Values") or {}
+        task_id = request.get("TaskId")
+
+        if request_type == "Heartbeat":
+            return {"GenericResult": True, "Service": self.service.stats()}
+
+        if request_type == "Submit":
+            try:
+                task = self.service.submit(values.get("FileName"), values.get("TemplatePath"),
+                                           parse_priority(values.get("Priority")), values.get("DeadlineMs"))
+            except QueueFullError as e:
+                return {"GenericResult": False, "Error": str(e)}
+            return task.response()
+
+        if request_type in ("SubmitImage", "SubmitImageChunk"):
+            try:
+                if request_type == "SubmitImage":
+                    task = self.service.submit(values.get("FileName"), values.get("TemplatePath"),
+                                               parse_priority(values.get("Priority")), values.get("DeadlineMs"),
+                                               base64.b64decode(values.get("ImageData", "")))
+                else:
+                    task = self.service.add_chunk(values)
+            except (QueueFullError, ValueError) as e:
+                return {"GenericResult": False, "Error": str(e)}
+            if task is None:
+                return {"GenericResult": True, "UploadId": values.get("UploadId"), "Received": values.get("Index")}
+            return task.response()
+
+        if request_type == "SubmitBatch":
+            # Batches are backlog work unless the client says otherwise
+            priority = parse_priority(values.get("Priority", "bulk"))
+            task_ids = []
+            for filename in values.get("FileNames") or []:
+                try:
+                    task_ids.append(self.service.submit(filename, values.get("TemplatePath"), priority,
+                                                        values.get("DeadlineMs")).task_id)
+                except QueueFullError:
+                    task_ids.append(None)
+            return {"GenericResult": True, "TaskIds": task_ids}
+
+        if request_type in ("GetAsyncTaskStatus", "CancelAsyncTask", "WaitAsyncTask"):
+            if request_type == "CancelAsyncTask":
+                task = self.service.cancel(task_id)
+            else:
+                task = self.service.get(task_id)
+            if task is None:
+                return {"TaskId": task_id, "GenericResult": False, "Error": "Unknown TaskId"}
+            if request_type == "WaitAsyncTask":
+                task.done.wait(max(0, values.get("TimeoutMs", 0)) / 1000.0)
+            return task.response()
+
+        if request_type == "GetAsyncTaskStatusBatch":
+            tasks = [self.service.get(tid) for tid in values.get("TaskIds") or []]
+            return {"GenericResult": True, "Tasks": [t.response() for t in tasks if t is not None]}
+
+        return {"GenericResult": False, "Error": f"Unknown RequestType: {request_type}"}
+
+
+class DecodeTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service: DecodeService):
+        self.service = service
+        super().__init__(address, DecodeRequestHandler)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Multi-worker Dynamsoft decode service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--queue-size", type=int, default=64, help="Queued tasks allowed per priority class")
+    parser.add_argument("--live-reserved", type=int, default=1, help="Workers that only take live-cycle tasks")
+    parser.add_argument("--template", default=None, help="Default template (DynamsoftBarcodeReader default if omitted)")
+    args = parser.parse_args()
+
+    try:
+        service = DecodeService(args.workers, args.queue_size, args.template, live_reserved=args.live_reserved)
+        with DecodeTCPServer((args.host, args.port), service) as server:
+            logger.info(f"Listening on {args.host}:{args.port}")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Fatal error: {e}", exc_info=True)
+        sys.exit(1)
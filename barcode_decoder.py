@@ -0,0 +1,508 @@
+# Barcode Decoder Strategies
+# Author: Sujai Rajan
+# Works with test_gui.py, dynamsoft_server_code.py and barcode_testing.py
+#
+# One decode() entry point for the HMI with three strategies:
+#   remote - decode server (fails over to local while the server circuit is open)
+#   local  - Dynamsoft on the Pi
+#   race   - both at once, first valid DataMatrix wins
+# Every decoder keeps its own latency stats so a station can pick a strategy.
+
+import os
+import time
+import threading
+import concurrent.futures
+from collections import deque
+from statistics import median_low
+
+from json_store import load_json, save_json
+from dynamsoft_server_code import process_barcode, process_barcode_image, process_barcode_batch, get_server, get_health
+
+
+SMB_MOUNT = "/mt/barcode_dropbox"
+
+
+# ---------- Results / Stats ----------
+class DecodeResult:
+    """Outcome of one decode attempt."""
+
+    def __init__(self, text=None, source=None, elapsed=0.0, error=None, corners=None, tier=None, template=None,
+                 rejected=None, unreachable=False):
+        self.text = text
+        self.source = source
+        self.elapsed = elapsed
+        self.error = error
+        self.corners = corners      # barcode corner points in pixels of the decoded image, if known
+        self.tier = tier            # cascade tier that produced the read, if any
+        self.template = template    # Dynamsoft template that produced the read, if not the default
+        self.rejected = rejected    # text that was read but failed the board's serial format
+        self.unreachable = unreachable  # remote could not take or finish the decode; worth retrying locally
+
+    @property
+    def ok(self):
+        return bool(self.text) and self.text != "-1"
+
+    def __repr__(self):
+        tier = f"/{self.tier}" if self.tier else ""
+        rejected = f", rejected={self.rejected!r}" if self.rejected else ""
+        return f"DecodeResult({self.source}{tier}: {self.text!r}, {self.elapsed:.2f}s, error={self.error!r}{rejected})"
+
+
+class LatencyStats:
+    """Rolling latency and hit counts for one decoder."""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.hits = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        with self._lock:
+            self.count += 1
+            self.samples.append(result.elapsed)
+            if result.ok:
+                self.hits += 1
+            if result.error:
+                self.errors += 1
+
+    def percentile(self, pct):
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+    def summary(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        if p50 is None:
+            return "no samples"
+        return f"n={self.count}, hits={self.hits}, errors={self.errors}, p50={p50:.2f}s, p95={p95:.2f}s"
+
+
+def check_serial(result, rules, board):
+    """Clear a read that breaks the board's serial format (kept in .rejected) so it counts as a miss
+    and cascades / races keep going. No-op without rules or for non-reads."""
+    if rules is None or not result.ok:
+        return result
+    reason = rules.check(result.text, board)
+    if reason is not None:
+        print(f"[DECODE] Rejected {result.text!r} for {board}: {reason}")
+        result.rejected, result.text = result.text, None
+    return result
+
+
+def _image_path(image):
+    """Accept a file path or a robot-core CaptureResult (waits for its background save)."""
+    if hasattr(image, "wait_saved"):
+        return image.wait_saved()
+    return image
+
+
+# ---------- Decoders ----------
+class RemoteDecoder:
+    """Decode through the task server. By default the image must be on the barcode_dropbox share;
+    with inline_images the ROI crop is sent in the request (JPEG or PNG) and the share is bypassed."""
+
+    name = "remote"
+
+    def __init__(self, host="10.40.17.62", port=9000, framing="close", timeout=30.0,
+                 template="templates/ReadDPM.json", inline_images=False, inline_format="jpeg", **health_opts):
+        self.server_opts = {"host": host, "port": port, "framing": framing, "timeout": timeout}
+        self.health_opts = health_opts
+        self.template = template
+        self.inline_images = inline_images
+        self.inline_format = inline_format
+        self.stats = LatencyStats()
+
+    @property
+    def health(self):
+        server = get_server(self.server_opts["host"], self.server_opts["port"], self.server_opts["framing"])
+        return get_health(server, **self.health_opts)
+
+    def available(self):
+        return not self.health.is_open
+
+    def _encode(self, capture):
+        if self.inline_format == "png":
+            import cv2
+            ok, buf = cv2.imencode(".png", capture.crop)
+            return buf.tobytes() if ok else b""
+        return capture.jpeg()
+
+    def _decode_inline(self, capture, side):
+        """Inline decode of a CaptureResult -> (text, corners); None if the server does not take inline images."""
+        server = get_server(self.server_opts["host"], self.server_opts["port"], self.server_opts["framing"])
+        if server.inline_supported is False:
+            return None
+        data = self._encode(capture)
+        if not data:
+            raise IOError(f"{side} image could not be encoded")
+        try:
+            return process_barcode_image(data, self.template, encoding=self.inline_format,
+                                         name=os.path.basename(capture.path or f"{side}.{self.inline_format}"),
+                                         return_corners=True, **self.server_opts, **self.health_opts)
+        except RuntimeError:
+            if server.inline_supported is False:
+                print("[DECODE] Decode server does not accept inline images, using the share")
+                return None
+            raise
+
+    def decode(self, image, side):
+        t_start = time.perf_counter()
+        try:
+            if self.inline_images and hasattr(image, "jpeg"):
+                decoded = self._decode_inline(image, side)
+                if decoded is not None:
+                    # Corners are in pixels of the ROI crop that was sent
+                    result = DecodeResult(decoded[0], self.name, time.perf_counter() - t_start, corners=decoded[1])
+                    self.stats.record(result)
+                    return result
+            path = _image_path(image)
+            if not path:
+                raise IOError(f"{side} image could not be saved")
+            relative_path = path.replace(SMB_MOUNT + "/", "")
+            code, corners = process_barcode(relative_path, f"/tmp/barcode_{side}.txt", self.template,
+                                            return_corners=True, **self.server_opts, **self.health_opts)
+            # The saved JPEG is the ROI crop, so these corners are in crop pixels as well
+            result = DecodeResult(code, self.name, time.perf_counter() - t_start, corners=corners)
+        except OSError as e:
+            # Circuit open (ServerUnavailableError), refused / reset / unreachable, timed out, or the image
+            # could not be saved for the share; all of them leave a local decode worth trying
+            result = DecodeResult(None, self.name, time.perf_counter() - t_start, f"Remote decode failed: {e}",
+                                  unreachable=True)
+        except Exception as e:
+            result = DecodeResult(None, self.name, time.perf_counter() - t_start, f"Remote decode failed: {e}")
+        self.stats.record(result)
+        return result
+
+    def decode_batch(self, paths, timeout=600.0):
+        """Decode saved images on the share as one bulk job; one DecodeResult per path."""
+        t_start = time.perf_counter()
+        opts = dict(self.server_opts, timeout=timeout, **self.health_opts)
+        try:
+            codes = process_barcode_batch([p.replace(SMB_MOUNT + "/", "") for p in paths], self.template, **opts)
+        except Exception as e:
+            return [DecodeResult(None, self.name, time.perf_counter() - t_start, f"Remote batch decode failed: {e}")
+                    for _ in paths]
+        elapsed = time.perf_counter() - t_start
+        return [DecodeResult(code, self.name, elapsed) if code is not None
+                else DecodeResult(None, self.name, elapsed, "Remote batch decode: not queued or not finished")
+                for code in codes]
+
+
+class LocalDecoder:
+    """Decode on the Pi with a warm Dynamsoft reader pool from barcode_testing."""
+
+    name = "local"
+
+    def __init__(self, workers=2, template_path=None):
+        self.workers = workers
+        self.template_path = template_path
+        self.stats = LatencyStats()
+        self._module = None
+
+    def _reader_module(self):
+        # Imported lazily so remote-only stations do not need the Dynamsoft bundle
+        if self._module is None:
+            import barcode_testing
+            self._module = barcode_testing
+        return self._module
+
+    def available(self):
+        try:
+            self._reader_module()
+            return True
+        except Exception:
+            return False
+
+    def decode(self, image, side, template=None):
+        t_start = time.perf_counter()
+        try:
+            pool = self._reader_module().get_reader_pool(self.workers, self.template_path)
+            # In-memory ROI crop when the robot core handed us a capture: raw pixels, no JPEG
+            # round trip (and no compression artifacts on the DPM marks), no file
+            crop = getattr(image, "crop", None)
+            if crop is not None:
+                results = pool.decode(crop, template_name=template)
+            elif hasattr(image, "jpeg"):
+                results = pool.decode(image.jpeg(), template_name=template)
+            else:
+                results = pool.decode(image, template_name=template)
+            if results:
+                corners = [(p.x, p.y) for p in results[0].get_corner_points()]
+                result = DecodeResult(results[0].barcode_text, self.name, time.perf_counter() - t_start,
+                                      corners=corners, template=template)
+            else:
+                result = DecodeResult(None, self.name, time.perf_counter() - t_start)
+        except Exception as e:
+            result = DecodeResult(None, self.name, time.perf_counter() - t_start, f"Local decode failed: {e}")
+        self.stats.record(result)
+        return result
+
+
+# ---------- Resolution Cascade ----------
+class CascadeDecoder:
+    """
+    Wrap an in-memory decoder (LocalDecoder / ProcessDecoder) and try cheap inputs first:
+    half-resolution ROI, then full-resolution ROI, then the full frame. A tier only runs
+    if the previous one missed. Corners are returned in ROI-crop pixels like a plain decode.
+    Paths (no in-memory capture) go straight to the wrapped decoder.
+    """
+
+    TIERS = ("roi_half", "roi_full", "frame")
+    summary_label = "local tiers"
+
+    def __init__(self, decoder, scale=0.5, tiers=TIERS, rules=None):
+        self.decoder = decoder
+        self.rules = rules
+        self.name = decoder.name
+        self.scale = scale
+        self.tiers = [t for t in self.TIERS if t in tiers]
+        self.stats = LatencyStats()
+        self.tier_hits = {t: 0 for t in self.TIERS}
+        self._lock = threading.Lock()
+
+    def available(self):
+        return self.decoder.available()
+
+    def _inputs(self, capture):
+        """Yield (tier, image, to_crop_px) lazily so skipped tiers cost nothing."""
+        for tier in self.tiers:
+            if tier == "roi_half":
+                import cv2
+                small = cv2.resize(capture.crop, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+                yield tier, small, lambda pts: [(x / self.scale, y / self.scale) for x, y in pts]
+            elif tier == "roi_full":
+                yield tier, capture.crop, lambda pts: pts
+            elif capture.roi:
+                # Full frame: shift corners into crop coordinates (may go negative, to_frame_norm undoes it)
+                fh, fw = capture.frame.shape[:2]
+                ox, oy = max(0, int(capture.roi[0] * fw)), max(0, int(capture.roi[1] * fh))
+                yield tier, capture.frame, lambda pts, ox=ox, oy=oy: [(x - ox, y - oy) for x, y in pts]
+
+    def decode(self, image, side, **kw):
+        if getattr(image, "crop", None) is None:
+            return self.decoder.decode(image, side, **kw)
+
+        t_start = time.perf_counter()
+        result = None
+        for tier, img, to_crop_px in self._inputs(image):
+            result = check_serial(self.decoder.decode(img, side, **kw), self.rules, getattr(image, "board", None))
+            if result.ok:
+                with self._lock:
+                    self.tier_hits[tier] += 1
+                corners = to_crop_px(result.corners) if result.corners else None
+                result = DecodeResult(result.text, self.name, time.perf_counter() - t_start,
+                                      result.error, corners, tier, result.template)
+                break
+        else:
+            if result is None:
+                result = DecodeResult(None, self.name, time.perf_counter() - t_start)
+            else:
+                result = DecodeResult(result.text, self.name, time.perf_counter() - t_start, result.error,
+                                      rejected=result.rejected)
+        self.stats.record(result)
+        return result
+
+    def tier_summary(self):
+        with self._lock:
+            return ", ".join(f"{t}={n}" for t, n in self.tier_hits.items())
+
+
+# ---------- Template Tiers ----------
+class TierMemory:
+    """Recent winning template tier per board/side, kept in a small JSON file."""
+
+    def __init__(self, path=None, history=20):
+        self.path = os.path.expanduser(path) if path else None
+        self.history = history
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self):
+        return load_json(self.path, {}, "DECODE", "template tier memory")
+
+    def _save(self):
+        save_json(self.path, self._data, "DECODE", "template tier memory")
+
+    def record(self, board, side, template):
+        with self._lock:
+            recent = self._data.setdefault(f"{board}/{side}", [])
+            recent.append(template)
+            del recent[:-self.history]
+            self._save()
+
+    def start(self, board, side, tiers):
+        """Index of the tier to start at: the median recent winner, so a board that usually needs
+        full DPM skips the cheap tiers, while one that mostly reads fast is not held back by outliers."""
+        with self._lock:
+            recent = [tiers.index(t) for t in self._data.get(f"{board}/{side}", []) if t in tiers]
+        return median_low(recent) if recent else 0
+
+
+class TemplateTierDecoder:
+    """
+    Wrap a local decoder and escalate through Dynamsoft templates (cheapest first) only when a
+    template reads nothing. Starts each board/side at the tier that usually wins for it; tiers
+    below the start are still tried last, as they are cheap. The wrapped decoder's template file
+    must contain every tier template. Paths and captures without a board start at the first tier.
+    """
+
+    summary_label = "local templates"
+
+    def __init__(self, decoder, tiers, memory=None, rules=None):
+        self.decoder = decoder
+        self.rules = rules
+        self.name = decoder.name
+        self.tiers = list(tiers)
+        self.memory = memory or TierMemory()
+        self.stats = LatencyStats()
+        self.tier_hits = {t: 0 for t in self.tiers}
+        self._lock = threading.Lock()
+
+    def available(self):
+        return self.decoder.available()
+
+    def decode(self, image, side):
+        t_start = time.perf_counter()
+        board = getattr(image, "board", None)
+        start = self.memory.start(board, side, self.tiers) if board else 0
+        result = None
+        for template in self.tiers[start:] + self.tiers[:start]:
+            result = check_serial(self.decoder.decode(image, side, template=template), self.rules, board)
+            if result.ok:
+                with self._lock:
+                    self.tier_hits[template] += 1
+                if board:
+                    self.memory.record(board, side, template)
+                break
+        result = DecodeResult(result.text, self.name, time.perf_counter() - t_start, result.error,
+                              result.corners, result.tier, result.template, result.rejected)
+        self.stats.record(result)
+        return result
+
+    def tier_summary(self):
+        with self._lock:
+            return ", ".join(f"{t}={n}" for t, n in self.tier_hits.items())
+
+
+# ---------- Strategy ----------
+class BarcodeDecoder:
+    """Pick remote, local or race decoding; fail over to local while the remote circuit is open."""
+
+    STRATEGIES = ("remote", "local", "race")
+
+    def __init__(self, strategy="remote", remote=None, local=None, cache=None, template=None, rules=None):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown decode strategy: {strategy}")
+        self.strategy = strategy
+        self.remote = remote or RemoteDecoder()
+        self.local = local or LocalDecoder()
+        self.cache = cache
+        self.rules = rules
+        # Template name is part of the cache key; defaults to the remote template's file name
+        self.template = template or os.path.splitext(os.path.basename(self.remote.template))[0]
+        self.stats = {"remote": self.remote.stats, "local": self.local.stats, "race": LatencyStats()}
+        self._race_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="decode-race")
+
+    def is_valid(self, text):
+        return bool(text) and text != "-1"
+
+    def decode(self, image, side, board=None):
+        """Decode through the cache (if any, saved files only), then the configured strategy. Reads that break
+        `board`'s serial format (default: the capture's board) come back with text None."""
+        board = board or getattr(image, "board", None)
+        # Live crops differ in every frame, so only saved files can hit the exact-content cache
+        if self.cache is None or not isinstance(image, str):
+            return check_serial(self._decode(image, side, board), self.rules, board)
+
+        t_start = time.perf_counter()
+        try:
+            key = self.cache.key(image, self.template)
+        except Exception as e:
+            print("[DECODE_CACHE] Could not hash image, decoding uncached:", e)
+            return check_serial(self._decode(image, side, board), self.rules, board)
+        cached = self.cache.get(key)
+        if cached is not None:
+            text, corners = cached
+            return check_serial(DecodeResult(text, "cache", time.perf_counter() - t_start, corners=corners),
+                                self.rules, board)
+
+        result = self._decode(image, side, board)
+        # Reads and clean misses are cached; transport errors are retried next time
+        if not result.error:
+            self.cache.put(key, result.text, result.corners)
+        return check_serial(result, self.rules, board)
+
+    def decode_batch(self, paths, board=None, timeout=600.0):
+        """Re-decode saved images (e.g. failed_links) on the server as one bulk job.
+        Files already in the cache are not sent; results come back in `paths` order."""
+        results = [None] * len(paths)
+        keys = [None] * len(paths)
+        todo = []
+        for i, path in enumerate(paths):
+            if self.cache is not None:
+                try:
+                    keys[i] = self.cache.key(path, self.template)
+                    cached = self.cache.get(keys[i])
+                except Exception as e:
+                    print("[DECODE_CACHE] Could not hash image, decoding uncached:", e)
+                    cached = None
+                if cached is not None:
+                    results[i] = DecodeResult(cached[0], "cache", 0.0, corners=cached[1])
+                    continue
+            todo.append(i)
+
+        if todo:
+            for i, result in zip(todo, self.remote.decode_batch([paths[i] for i in todo], timeout)):
+                if keys[i] is not None and not result.error:
+                    self.cache.put(keys[i], result.text, result.corners)
+                results[i] = result
+        return [check_serial(result, self.rules, board) for result in results]
+
+    def _decode(self, image, side, board=None):
+        if self.strategy == "local":
+            return self.local.decode(image, side)
+        if self.strategy == "race":
+            return self._race(image, side, board)
+
+        # remote, with automatic failover: skip it while the circuit is open, and fall back on the outcome
+        # too (lost the half-open trial to the other side, or the trial itself failed)
+        if not self.remote.available() and self.local.available():
+            print(f"[DECODE] Remote circuit open, decoding {side} locally")
+            return self.local.decode(image, side)
+        result = self.remote.decode(image, side)
+        if result.unreachable and self.local.available():
+            print(f"[DECODE] {result.error}; decoding {side} locally")
+            return self.local.decode(image, side)
+        return result
+
+    def _race(self, image, side, board=None):
+        """Run remote and local together; return the first read that passes the serial format, else the last result."""
+        t_start = time.perf_counter()
+        decoders = [d for d in (self.remote, self.local) if d.available()] or [self.remote]
+        futures = [self._race_pool.submit(d.decode, image, side) for d in decoders]
+        result = None
+        for fut in concurrent.futures.as_completed(futures):
+            result = check_serial(fut.result(), self.rules, board)
+            if self.is_valid(result.text):
+                break
+        # Losing decoder keeps running in the pool; its result still lands in its own stats
+        race_result = DecodeResult(result.text, result.source, time.perf_counter() - t_start,
+                                   result.error, result.corners, rejected=result.rejected)
+        self.stats["race"].record(race_result)
+        return race_result
+
+    def summary(self):
+        text = "; ".join(f"{name}: {stats.summary()}" for name, stats in self.stats.items())
+        # Tier counts from any cascade / template-tier wrappers around the local decoder
+        decoder = self.local
+        while decoder is not None:
+            if hasattr(decoder, "tier_summary"):
+                text += f"; {decoder.summary_label}: {decoder.tier_summary()}"
+            decoder = getattr(decoder, "decoder", None)
+        if self.cache is not None:
+            text += f"; cache: {self.cache.summary()}"
+        return text
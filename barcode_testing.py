@@ -0,0 +1,139 @@
+# Trial till 30th October
+LICENSE_KEY = "t0087YQEAALQSlRqVqKDfO7NjfKgmBb6/JJtlcIZvD8HBLh3Xtg/oItZXV6A6ZAAB2TG4FqUQ3Xi8GXP9aSf3S/1nnqytEErTfjD9o8ndNN6bES6vqhvasEmY"  # your short key
+_READER = None  # global singleton
+
+_LICENSE_READY = False
+_POOLS = {}  # (template_path, size) -> ReaderPool
+
+# --- Dynamsoft Barcode Reader Integration ---
+from dynamsoft_barcode_reader_bundle import LicenseManager, CaptureVisionRouter, EnumErrorCode
+from contextlib import contextmanager
+import json
+import os
+import queue
+import threading
+
+_INIT_LOCK = threading.Lock()
+
+
+def init_license():
+    """Activate the Dynamsoft license once per process."""
+    global _LICENSE_READY
+    with _INIT_LOCK:
+        if not _LICENSE_READY:
+            code, msg = LicenseManager.init_license(LICENSE_KEY)
+            if code not in (EnumErrorCode.EC_OK, EnumErrorCode.EC_LICENSE_WARNING):
+                print(f"[ERROR] License error ({code}): {msg}")
+            else:
+                print("[INFO] Dynamsoft license activated successfully.")
+            _LICENSE_READY = True
+
+
+def get_barcode_reader():
+    """
+    Initialize and return a shared Dynamsoft CaptureVisionRouter instance.
+    Call this once and reuse for multiple decode_file() calls.
+    """
+    global _READER
+    if _READER is None:
+        init_license()
+        _READER = CaptureVisionRouter()
+    return _READER
+
+
+class ReaderPool:
+    """
+    N warm CaptureVisionRouters with the template already loaded, leased one per decode
+    so local decodes can run in parallel with no per-call setup.
+    """
+
+    def __init__(self, size=2, template_path=None):
+        init_license()
+        self.template_name = ""
+        if template_path:
+            template_path = os.path.expanduser(template_path)
+            with open(template_path) as f:
+                self.template_name = json.load(f)["CaptureVisionTemplates"][0]["Name"]
+
+        self._routers = queue.Queue()
+        for _ in range(size):
+            router = CaptureVisionRouter()
+            if template_path:
+                code, msg = router.init_settings_from_file(template_path)
+                if code != EnumErrorCode.EC_OK:
+                    raise RuntimeError(f"Template load error ({code}): {msg}")
+            self._routers.put(router)
+        self.size = size
+
+    @contextmanager
+    def lease(self, timeout=None):
+        router = self._routers.get(timeout=timeout)
+        try:
+            yield router
+        finally:
+            self._routers.put(router)
+
+    def decode(self, image, timeout=None, template_name=None):
+        """Decode a file path, encoded image bytes or a BGR numpy frame; same return shape as decode_file().
+        template_name picks another template from the loaded file (tiered template sets)."""
+        template_name = template_name or self.template_name
+        with self.lease(timeout) as router:
+            if isinstance(image, str):
+                if not os.path.exists(image):
+                    print("[WARN] Image not found:", image)
+                    return []
+                result_array = router.capture_multi_pages(image, template_name)
+                pages = result_array.get_results()
+            else:
+                pages = [router.capture(image, template_name)]
+        return _first_barcode(pages)
+
+
+def get_reader_pool(size=2, template_path=None):
+    """Shared ReaderPool per (template, size), built on first use."""
+    key = (template_path, size)
+    with _INIT_LOCK:
+        pool = _POOLS.get(key)
+    if pool is None:
+        pool = ReaderPool(size, template_path)
+        with _INIT_LOCK:
+            pool = _POOLS.setdefault(key, pool)
+    return pool
+
+
+def _first_barcode(pages):
+    """Return a list with at most ONE barcode object, with legacy .barcode_text fields."""
+    for page in pages:
+        if page is None:
+            continue
+        barcodes = page.get_decoded_barcodes_result()
+        if not barcodes:
+            continue
+
+        items = barcodes.get_items()
+        if len(items) > 0:
+            b = items[0]  # ✅ Only first barcode
+            # mimic legacy attributes
+            b.barcode_text = b.get_text()
+            b.barcode_format_string = b.get_format_string()
+            return [b]  # wrap in list to match your existing code structure
+    return []
+
+
+def decode_file(reader, img_path):
+    """
+    Decode a single image and return a list with at most ONE barcode object.
+    The returned object mimics .barcode_text and .barcode_format_string fields.
+    """
+    if not os.path.exists(img_path):
+        print("[WARN] Image not found:", img_path)
+        return []
+
+    try:
+        result_array = reader.capture_multi_pages(img_path, "")
+        return _first_barcode(result_array.get_results())
+
+    except Exception as e:
+        print("[ERROR] Decode failed:", e)
+
+    return []  # none found
@@ -0,0 +1,111 @@
+# Decode Result Cache
+# Author: Sujai Rajan
+# Works with barcode_decoder.py and config.json
+#
+# Remembers decode results by file content + template so re-decoding a saved
+# JPEG (the failed_links batch, or the same file decoded again) returns instantly
+# instead of loading the decode server again. LRU with a TTL, optionally kept
+# in a small JSON file across restarts (written at most every save_interval seconds).
+#
+# The key is an exact content hash, not a perceptual one: boards of one type
+# look alike at low resolution and must never share a cached serial. The price
+# is that live camera crops never hit (sensor noise changes the bytes between
+# frames), so BarcodeDecoder only consults the cache for saved image files.
+
+import os
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+
+from json_store import load_json, save_json
+
+
+def content_hash(image):
+    """blake2b of the ROI crop pixels (CaptureResult / numpy frame), encoded bytes, or file contents."""
+    h = hashlib.blake2b(digest_size=16)
+    crop = getattr(image, "crop", image)
+    if hasattr(crop, "tobytes"):
+        h.update(str(crop.shape).encode())
+        h.update(crop.tobytes())
+    elif isinstance(crop, (bytes, bytearray)):
+        h.update(crop)
+    else:
+        with open(crop, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+class DecodeCache:
+    """LRU of (content hash, template) -> (text, corners). Reads and misses are both cached;
+    transport errors are not. Entries older than `ttl` seconds are ignored and evicted."""
+
+    def __init__(self, max_entries=256, ttl=600.0, path=None, save_interval=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = os.path.expanduser(path) if path else None
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> [text, corners, stored_at (wall clock)]
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+
+    # ---------- Store ----------
+    def _load(self):
+        data = load_json(self.path, [], "DECODE_CACHE", "cache file")
+        now = time.time()
+        for key, entry in data:
+            if now - entry[2] < self.ttl:
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        save_json(self.path, list(self._entries.items()), "DECODE_CACHE", "cache file")
+
+    # ---------- Lookup ----------
+    def key(self, image, template):
+        return f"{content_hash(image)}:{template}"
+
+    def get(self, key):
+        """Cached (text, corners) or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[2] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, text, corners=None):
+        with self._lock:
+            self._entries[key] = [text, corners, time.time()]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = bool(self.path)
+            if self._dirty and time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+
+    def flush(self):
+        """Write pending entries to the cache file now (also runs at exit)."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def summary(self):
+        with self._lock:
+            return f"entries={len(self._entries)}, hits={self.hits}, misses={self.misses}"
@@ -0,0 +1,183 @@
+# Process-Pool Decode Engine
+# Author: Sujai Rajan
+# Works with barcode_decoder.py, barcode_testing.py and test_gui.py
+#
+# Local Dynamsoft decoding of 12 MP DPM frames is CPU bound. Running it in the
+# HMI's threads shares the GIL with Tk and the polling, so this engine runs it in
+# worker processes instead, one warm reader per worker. Frames are handed over
+# through shared memory (name + shape only is pickled), paths are passed as is.
+# The segments are created once and reused; workers attach to each one once.
+
+import os
+import sys
+import time
+import atexit
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from barcode_decoder import DecodeResult, LatencyStats
+
+
+# ---------- Worker Side ----------
+_worker_pool = None     # ReaderPool(1) owned by each worker process
+_worker_segments = OrderedDict()    # segment name -> SharedMemory attached in this worker
+MAX_ATTACHED = 8
+
+
+def _init_worker(template_path):
+    global _worker_pool
+    import barcode_testing
+    _worker_pool = barcode_testing.ReaderPool(1, template_path)
+
+
+def _warm(_):
+    return os.getpid()
+
+
+def _unpack(results):
+    if not results:
+        return None, None
+    b = results[0]
+    return b.barcode_text, [(p.x, p.y) for p in b.get_corner_points()]
+
+
+def _decode_path(path, template=None):
+    return _unpack(_worker_pool.decode(path, template_name=template))
+
+
+def _attach(shm_name):
+    shm = _worker_segments.get(shm_name)
+    if shm is not None:
+        _worker_segments.move_to_end(shm_name)
+        return shm
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    else:
+        # Attaching registers the segment again, but with the resource tracker inherited from the
+        # parent (see start()) that is a no-op: the parent registered it at creation and unregisters
+        # it on unlink. Unregistering here would drop the parent's registration instead.
+        shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_segments[shm_name] = shm
+    while len(_worker_segments) > MAX_ATTACHED:
+        _worker_segments.popitem(last=False)[1].close()
+    return shm
+
+
+def _decode_shared(shm_name, shape, dtype, template=None):
+    shm = _attach(shm_name)
+    frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    result = _unpack(_worker_pool.decode(frame, template_name=template))
+    del frame       # release the view so the segment can be closed on eviction
+    return result
+
+
+# ---------- Engine ----------
+class ProcessDecoder:
+    """
+    Drop-in for LocalDecoder that decodes in a process pool sized to the cores.
+    Uses the fork start method so workers do not re-import the HMI; call start()
+    at startup, before Tk and the robot threads exist.
+    """
+
+    name = "local"
+
+    def __init__(self, workers=0, template_path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.template_path = template_path
+        self.stats = LatencyStats()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._segments = []     # idle shared memory segments, reused across decodes
+        atexit.register(self.shutdown)
+
+    def start(self):
+        """Fork the workers and load their readers now, so the first board does not pay for it."""
+        with self._lock:
+            if self._executor is None:
+                # Start the resource tracker before forking so the workers share it; a tracker started
+                # later would be one per worker, and would warn about and unlink the parent's segments
+                resource_tracker.ensure_running()
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("fork"),
+                    initializer=_init_worker,
+                    initargs=(self.template_path,))
+                list(self._executor.map(_warm, range(self.workers)))
+                print(f"[DECODE] Process decode engine ready: {self.workers} worker(s)")
+        return self._executor
+
+    def shutdown(self, broken=None):
+        """Stop the workers and unlink the shared memory segments. With `broken`, only if that
+        executor is still the current one (several threads may see the same crash)."""
+        with self._lock:
+            if broken is not None and self._executor is not broken:
+                return
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            segments, self._segments = self._segments, []
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+    def available(self):
+        try:
+            self.start()
+            return True
+        except Exception as e:
+            print("[ERROR] Process decode engine unavailable:", e)
+            return False
+
+    def _take_segment(self, nbytes):
+        with self._lock:
+            for i, shm in enumerate(self._segments):
+                if shm.size >= nbytes:
+                    return self._segments.pop(i)
+        return shared_memory.SharedMemory(create=True, size=nbytes)
+
+    def _give_segment(self, shm):
+        # Keep one idle segment per worker while the engine runs; drop the rest
+        with self._lock:
+            if self._executor is not None and len(self._segments) < self.workers:
+                self._segments.append(shm)
+                return
+        shm.close()
+        shm.unlink()
+
+    def _run(self, executor, image, template=None):
+        # Raw frame (cascade tiers) or a CaptureResult's in-memory ROI crop: share it, no JPEG or file
+        frame = image if isinstance(image, np.ndarray) else getattr(image, "crop", None)
+        if frame is None:
+            return executor.submit(_decode_path, image, template).result()
+
+        frame = np.ascontiguousarray(frame)
+        shm = self._take_segment(frame.nbytes)
+        try:
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)[:] = frame
+            return executor.submit(_decode_shared, shm.name, frame.shape, frame.dtype.str, template).result()
+        finally:
+            self._give_segment(shm)
+
+    def decode(self, image, side, template=None):
+        t_start = time.perf_counter()
+        executor = None
+        try:
+            executor = self.start()
+            text, corners = self._run(executor, image, template)
+            result = DecodeResult(text, self.name, time.perf_counter() - t_start, corners=corners, template=template)
+        except BrokenProcessPool as e:
+            # A worker died (native crash in the reader): drop the pool and its segments so the
+            # next decode forks a fresh one instead of failing until the HMI restarts
+            print("[ERROR] Process decode worker crashed, restarting the pool:", e)
+            self.shutdown(broken=executor)
+            result = DecodeResult(None, self.name, time.perf_counter() - t_start, f"Process decode failed: {e}")
+        except Exception as e:
+            result = DecodeResult(None, self.name, time.perf_counter() - t_start, f"Process decode failed: {e}")
+        self.stats.record(result)
+        return result
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import struct
+from typing import Dict, Any, Optional
+
+from dynamsoft_server_code import TaskState, SubmitRejectedError, _task_state, _require_task_id, _unknown_task
+
+
+class AsyncProcessingServer:
+    """
+    asyncio client for the decode task server, for keeping many tasks in flight at once
+    (several linker stations, or batch re-decoding of failed_links).
+
+    framing:
+        "newline" / "length" - one connection, requests pipelined; replies are matched to requests in order.
+                               A message carrying "Notification": true is treated as a pushed task update.
+        "close"              - one connection per request (original server), at most max_connections at a time.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 9000, framing: str = "newline",
+                 max_connections: int = 8, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.framing = framing
+        self.timeout = timeout
+        self._conn_slots = asyncio.Semaphore(max_connections)
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = []          # futures for in-flight requests, in send order
+        self._completions = {}      # task_id -> future resolved by a pushed notification or a poll
+        self._send_lock = asyncio.Lock()
+
+    # ---------- Connection ----------
+    async def connect(self):
+        if self.framing == "close" or self._writer is not None:
+            return
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = self._reader = None
+        self._fail_pending(ConnectionError("Client closed"))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _fail_pending(self, exc: Exception):
+        for fut in self._pending:
+            if not fut.done():
+                fut.set_exception(exc)
+        self._pending.clear()
+
+    # ---------- Framing ----------
+    def _frame(self, payload: bytes) -> bytes:
+        if self.framing == "length":
+            return struct.pack(">I", len(payload)) + payload
+        if self.framing == "newline":
+            return payload + b"\n"
+        return payload
+
+    async def _read_message(self, reader: asyncio.StreamReader) -> bytes:
+        if self.framing == "length":
+            (length,) = struct.unpack(">I", await reader.readexactly(4))
+            return await reader.readexactly(length)
+        if self.framing == "newline":
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Server closed connection")
+            return line.rstrip(b"\n")
+        # "close": read until the reply parses or the server closes
+        data = b""
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return data
+            data += chunk
+            try:
+                json.loads(data.decode("utf-8"))
+                return data
+            except ValueError:
+                continue
+
+    async def _read_loop(self):
+        try:
+            while True:
+                message = json.loads((await self._read_message(self._reader)).decode("utf-8"))
+                if message.get("Notification"):
+                    self._resolve(message)
+                    continue
+                if self._pending:
+                    fut = self._pending.pop(0)
+                    if not fut.done():
+                        fut.set_result(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Connection lost: fail everything in flight, next request reconnects
+            self._writer = self._reader = None
+            self._reader_task = None
+            self._fail_pending(ConnectionError(f"Decode server connection lost: {e}"))
+
+    def _resolve(self, response: Dict[str, Any]):
+        if _task_state(response) != TaskState.Completed:
+            return
+        fut = self._completions.get(response.get("TaskId"))
+        if fut is not None and not fut.done():
+            fut.set_result(response)
+
+    # ---------- Requests ----------
+    async def send_request(self, request_type: str, values: Dict[str, Any] = None,
+                           task_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Send a request and await its reply.
+        """
+        request = {"RequestType": request_type, "Values": values or {}}
+        if task_id:
+            request["TaskId"] = task_id
+        payload = self._frame(json.dumps(request).encode("utf-8"))
+
+        if self.framing == "close":
+            async with self._conn_slots:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout)
+                try:
+                    writer.write(payload)
+                    await writer.drain()
+                    data = await asyncio.wait_for(self._read_message(reader), self.timeout)
+                finally:
+                    writer.close()
+                return json.loads(data.decode("utf-8"))
+
+        fut = asyncio.get_running_loop().create_future()
+        async with self._send_lock:
+            await self.connect()
+            # Register before writing so the reply can never beat its future
+            self._pending.append(fut)
+            self._writer.write(payload)
+            await self._writer.drain()
+        return await asyncio.wait_for(fut, self.timeout)
+
+    async def heartbeat(self) -> Dict[str, Any]:
+        return await self.send_request("Heartbeat")
+
+    async def submit(self, filename: str, templatePath: str, priority: Optional[str] = None,
+                     deadline_ms: Optional[int] = None) -> str:
+        """
+        Submit a file for decoding and return its TaskId. priority / deadline_ms as for ProcessingServer.submit.
+        Raises SubmitRejectedError if the server did not queue it (e.g. queue full).
+        """
+        values = {"FileName": filename, "TemplatePath": templatePath}
+        if priority is not None:
+            values["Priority"] = priority
+        if deadline_ms is not None:
+            values["DeadlineMs"] = int(deadline_ms)
+        response = await self.send_request("Submit", values=values)
+        return _require_task_id(response)
+
+    async def status(self, task_id: str) -> Dict[str, Any]:
+        return await self.send_request("GetAsyncTaskStatus", task_id=task_id)
+
+    async def cancel(self, task_id: str) -> Dict[str, Any]:
+        return await self.send_request("CancelAsyncTask", task_id=task_id)
+
+    async def wait(self, task_id: str, timeout: float = 30.0, poll_start: float = 0.02,
+                   poll_max: float = 0.5) -> Dict[str, Any]:
+        """
+        Await task completion. Resolves on a pushed notification, otherwise polls with backoff.
+        Cancels the task and raises asyncio.TimeoutError after timeout seconds, or raises
+        SubmitRejectedError at once if the server does not know the task.
+        """
+        if not task_id:
+            raise ValueError("wait() needs a TaskId")
+        loop = asyncio.get_running_loop()
+        fut = self._completions.setdefault(task_id, loop.create_future())
+        deadline = loop.time() + timeout
+        interval = poll_start
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    try:
+                        await self.cancel(task_id)
+                    except Exception:
+                        pass
+                    raise asyncio.TimeoutError(f"Decode task {task_id} did not complete within {timeout:.1f}s")
+                try:
+                    return await asyncio.wait_for(asyncio.shield(fut), min(interval, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                response = await self.status(task_id)
+                if _task_state(response) == TaskState.Completed:
+                    return response
+                if _unknown_task(response):
+                    raise SubmitRejectedError(f"Decode task {task_id} is unknown to the server")
+                interval = min(interval * 1.5, poll_max)
+        finally:
+            self._completions.pop(task_id, None)
+
+    async def decode(self, filename: str, templatePath: str, timeout: float = 30.0,
+                     priority: Optional[str] = None) -> Optional[str]:
+        """
+        Submit and wait; returns the first serial or None.
+        """
+        task_id = await self.submit(filename, templatePath, priority, deadline_ms=timeout * 1000)
+        response = await self.wait(task_id, timeout=timeout)
+        serials = response.get("Results", {}).get("serials") or []
+        return str(serials[0]) if serials else None
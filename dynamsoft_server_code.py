@@ -2,7 +2,11 @@ import sys
 import socket
 import json
 import time
-from typing import Dict, Any, Optional
+import uuid
+import base64
+import struct
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 from enum import IntEnum
 from pathlib import Path
 
@@ -11,10 +15,155 @@ class TaskState(IntEnum):
     Processing = 1
     Completed = 2
     
+def _task_state(response: Dict[str, Any]) -> Optional[TaskState]:
+    try:
+        return TaskState(response.get("State"))
+    except Exception:
+        return None
+
+class SubmitRejectedError(RuntimeError):
+    """The server answered a Submit without a TaskId (queue full, bad request, ...)."""
+    pass
+
+def _require_task_id(response: Dict[str, Any], what: str = "Submit") -> str:
+    task_id = response.get("TaskId")
+    if not task_id or response.get("GenericResult") is False:
+        raise SubmitRejectedError(f"{what} rejected by decode server: {response.get('Error', response)}")
+    return task_id
+
+def _unknown_task(response: Dict[str, Any]) -> bool:
+    return "State" not in response and "Unknown TaskId" in str(response.get("Error", ""))
+
+def result_corners(response: Dict[str, Any]) -> Optional[List[Tuple[float, float]]]:
+    """
+    Corner points of the first barcode (Results.barcodes[0].ROI, x1..y4) in pixels of the
+    submitted image, or None when the server did not report them.
+    """
+    barcodes = response.get("Results", {}).get("barcodes") or []
+    roi = barcodes[0].get("ROI") if barcodes and isinstance(barcodes[0], dict) else None
+    if not roi:
+        return None
+    try:
+        corners = [(float(roi[f"x{i}"]), float(roi[f"y{i}"])) for i in range(1, 5)]
+    except (KeyError, TypeError, ValueError):
+        return None
+    # The reader reports -1 for every coordinate when it could not extract the points
+    if any(x < 0 or y < 0 for x, y in corners):
+        return None
+    return corners
+
+class _Connection:
+    """One socket plus its read buffer, so partial reads never mix between requests."""
+    def __init__(self, sock: socket.socket, framing: str):
+        self.sock = sock
+        self.framing = framing
+        self.buffer = b""
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _recv_more(self) -> bool:
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            return False
+        self.buffer += chunk
+        return True
+
+    def _recv_exact(self, n: int) -> bytes:
+        while len(self.buffer) < n:
+            if not self._recv_more():
+                raise ConnectionError("Server closed connection mid-message")
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def read_response(self) -> bytes:
+        if self.framing == "length":
+            (length,) = struct.unpack(">I", self._recv_exact(4))
+            return self._recv_exact(length)
+
+        if self.framing == "newline":
+            while b"\n" not in self.buffer:
+                if not self._recv_more():
+                    raise ConnectionError("Server closed connection mid-message")
+            line, _, self.buffer = self.buffer.partition(b"\n")
+            return line
+
+        # "close": reassemble until the reply parses or the server closes
+        while True:
+            if not self._recv_more():
+                break
+            try:
+                json.loads(self.buffer.decode("utf-8"))
+                break
+            except ValueError:
+                continue
+        data, self.buffer = self.buffer, b""
+        return data
+
 class ProcessingServer:
-    def __init__(self, host: str = "127.0.0.1", port: int = 9000):
+    """
+    Client for the decode task server. Safe to share between threads: every request uses its own
+    connection, so a held WaitAsyncTask never blocks another side's Submit or the heartbeat.
+
+    framing:
+        "close"   - one request per connection, server closes after replying (original server behaviour).
+                    The reply is read until it parses as complete JSON, so large replies are no longer cut at 4096 bytes.
+        "newline" - sockets kept open in a small pool, newline-delimited JSON in both directions.
+        "length"  - sockets kept open in a small pool, each message prefixed with a 4-byte big-endian length.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 9000, framing: str = "close", timeout: float = 10.0,
+                 max_idle: int = 4):
         self.host = host
         self.port = port
+        self.framing = framing
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: List[_Connection] = []
+        self._lock = threading.Lock()
+        self._server_wait_supported = None
+        self._batch_supported = None
+        self._inline_supported = None
+
+    def _connect(self) -> _Connection:
+        s = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return _Connection(s, self.framing)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _acquire(self) -> _Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, conn: _Connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- Framing ----------
+    def _frame(self, payload: bytes) -> bytes:
+        if self.framing == "length":
+            return struct.pack(">I", len(payload)) + payload
+        if self.framing == "newline":
+            return payload + b"\n"
+        return payload
 
     def send_request(self, request_type: str, values: Dict[str, Any] = None, task_id: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -32,17 +181,34 @@ class ProcessingServer:
         if task_id:
             request["TaskId"] = task_id
 
-        request_json = json.dumps(request)
+        payload = self._frame(json.dumps(request).encode("utf-8"))
 
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((self.host, self.port))
-            s.sendall(request_json.encode("utf-8"))
+        if self.framing == "close":
+            conn = self._connect()
+            try:
+                conn.sock.sendall(payload)
+                return json.loads(conn.read_response().decode("utf-8"))
+            finally:
+                conn.close()
 
-            response_data = s.recv(4096)
-            response_json = response_data.decode("utf-8")
-            response = json.loads(response_json)
-
-        return response
+        # Pooled persistent socket: a pooled one may have been dropped by the server (reset / EOF), retry
+        # once on a fresh one. Never after a timeout: the server may still be working on the request,
+        # and resending a Submit would queue a duplicate task.
+        for attempt in range(2):
+            conn = self._connect() if attempt else self._acquire()
+            try:
+                conn.sock.sendall(payload)
+                response = json.loads(conn.read_response().decode("utf-8"))
+            except ConnectionError:
+                conn.close()
+                if attempt == 1:
+                    raise
+                continue
+            except (OSError, ValueError):
+                conn.close()
+                raise
+            self._release(conn)
+            return response
 
     def heartbeat(self) -> Dict[str, Any]:
         """
@@ -50,12 +216,60 @@ class ProcessingServer:
         """
         return self.send_request("Heartbeat")
         
-    def submit(self, filename: str, templatePath: str) -> Dict[str, Any]:
+    def submit(self, filename: str, templatePath: str, priority: Optional[str] = None,
+               deadline_ms: Optional[int] = None) -> Dict[str, Any]:
         """
         Send a submit request with a filename.
+        priority ("live" / "retry" / "bulk") and deadline_ms are scheduling hints for the decode service;
+        servers that do not know them ignore them.
         """
-        return self.send_request("Submit", values={"FileName": filename, "TemplatePath": templatePath})
+        values = {"FileName": filename, "TemplatePath": templatePath}
+        if priority is not None:
+            values["Priority"] = priority
+        if deadline_ms is not None:
+            values["DeadlineMs"] = int(deadline_ms)
+        return self.send_request("Submit", values=values)
         
+    @property
+    def inline_supported(self) -> Optional[bool]:
+        """False once the server has rejected SubmitImage, None until tried."""
+        return self._inline_supported
+
+    def submit_image(self, data: bytes, templatePath: str, encoding: str = "jpeg", name: Optional[str] = None,
+                     priority: Optional[str] = None, deadline_ms: Optional[int] = None,
+                     chunk_size: int = 256 * 1024) -> Dict[str, Any]:
+        """
+        Submit encoded image bytes (JPEG/PNG) in the request itself instead of a path on the share.
+        Images larger than chunk_size are streamed as SubmitImageChunk messages; the last one queues the task.
+        Raises RuntimeError if the server does not accept inline images.
+        """
+        values = {"Encoding": encoding, "FileName": name or f"inline.{encoding}", "TemplatePath": templatePath}
+        if priority is not None:
+            values["Priority"] = priority
+        if deadline_ms is not None:
+            values["DeadlineMs"] = int(deadline_ms)
+
+        if len(data) <= chunk_size:
+            response = self.send_request("SubmitImage", values=dict(values, ImageData=base64.b64encode(data).decode("ascii")))
+        else:
+            upload_id = uuid.uuid4().hex
+            chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+            for index, chunk in enumerate(chunks):
+                chunk_values = {"UploadId": upload_id, "Index": index, "Final": index == len(chunks) - 1,
+                                "Data": base64.b64encode(chunk).decode("ascii")}
+                if index == 0:
+                    chunk_values.update(values)
+                response = self.send_request("SubmitImageChunk", values=chunk_values)
+                if response.get("GenericResult") is False:
+                    break
+
+        if not response.get("TaskId"):
+            if "Unknown RequestType" in str(response.get("Error", "")) or response.get("GenericResult") is None:
+                self._inline_supported = False
+            raise SubmitRejectedError(f"Inline image submit rejected: {response.get('Error', response)}")
+        self._inline_supported = True
+        return response
+
     def get_async_task_status(self, task_id: str) -> Dict[str, Any]:
         """
         Send a submit request with a filename.
@@ -68,6 +282,93 @@ class ProcessingServer:
         """
         return self.send_request("CancelAsyncTask", task_id=task_id)
 
+    def submit_batch(self, filenames: List[str], templatePath: str, priority: str = "bulk") -> List[Optional[str]]:
+        """
+        Submit many files in one SubmitBatch exchange and return their TaskIds in the same order.
+        Falls back to one Submit per file if the server does not know SubmitBatch.
+        """
+        if self._batch_supported is not False:
+            response = self.send_request("SubmitBatch", values={"FileNames": list(filenames), "TemplatePath": templatePath,
+                                                                "Priority": priority})
+            task_ids = response.get("TaskIds")
+            if isinstance(task_ids, list) and len(task_ids) == len(filenames):
+                self._batch_supported = True
+                return task_ids
+            self._batch_supported = False
+        return [self.submit(f, templatePath, priority).get("TaskId") for f in filenames]
+
+    def get_batch_status(self, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Status of many tasks in one GetAsyncTaskStatusBatch exchange, keyed by TaskId.
+        Falls back to one GetAsyncTaskStatus per task.
+        """
+        if self._batch_supported is not False:
+            response = self.send_request("GetAsyncTaskStatusBatch", values={"TaskIds": list(task_ids)})
+            tasks = response.get("Tasks")
+            if isinstance(tasks, list):
+                return {t.get("TaskId"): t for t in tasks}
+        return {tid: self.get_async_task_status(tid) for tid in task_ids}
+
+    def wait_async_task(self, task_id: str, timeout_ms: int) -> Dict[str, Any]:
+        """
+        Ask the server to hold the reply until the task completes or timeout_ms passes.
+        """
+        return self.send_request("WaitAsyncTask", values={"TimeoutMs": timeout_ms}, task_id=task_id)
+
+    def wait_for_task(self, task_id: str, timeout: float = 30.0, poll_start: float = 0.02,
+                      poll_max: float = 0.5, use_server_wait: bool = True) -> Dict[str, Any]:
+        """
+        Block until the task is Completed and return its final status response.
+
+        Uses the server-side WaitAsyncTask request when the server supports it, otherwise
+        polls GetAsyncTaskStatus starting at poll_start seconds and backing off to poll_max.
+        Raises TimeoutError (after cancelling the task) if it does not finish within timeout.
+        """
+        if not task_id:
+            raise ValueError("wait_for_task needs the TaskId returned by Submit")
+        deadline = time.monotonic() + timeout
+
+        if use_server_wait and self._server_wait_supported is not False:
+            interval = poll_start
+            while time.monotonic() < deadline:
+                # Keep each held request well inside the socket timeout
+                wait_s = min(deadline - time.monotonic(), self.timeout * 0.8)
+                t_sent = time.monotonic()
+                try:
+                    response = self.wait_async_task(task_id, max(int(wait_s * 1000), 1))
+                except (OSError, ValueError):
+                    # Connection trouble, not proof the server lacks WaitAsyncTask: poll this time
+                    break
+                if _unknown_task(response):
+                    raise SubmitRejectedError(f"Decode task {task_id} is unknown to the server")
+                # A server without WaitAsyncTask replies without a State (TaskId is known good here)
+                if "State" not in response:
+                    self._server_wait_supported = False
+                    break
+                self._server_wait_supported = True
+                if _task_state(response) == TaskState.Completed:
+                    return response
+                # Server answered without holding the request: back off instead of spinning
+                if time.monotonic() - t_sent < wait_s * 0.5:
+                    time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+                    interval = min(interval * 1.5, poll_max)
+
+        interval = poll_start
+        while time.monotonic() < deadline:
+            response = self.get_async_task_status(task_id)
+            if _unknown_task(response):
+                raise SubmitRejectedError(f"Decode task {task_id} is unknown to the server")
+            if _task_state(response) == TaskState.Completed:
+                return response
+            time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(interval * 1.5, poll_max)
+
+        try:
+            self.cancel_async_task(task_id)
+        except Exception:
+            pass
+        raise TimeoutError(f"Decode task {task_id} did not complete within {timeout:.1f}s")
+
     def print_response(self, response: Dict[str, Any]):
         print("Server Response:")
         print(f"  TaskId: {response.get('TaskId')}")
@@ -85,7 +386,167 @@ class ProcessingServer:
         for key, value in response.get("Results", {}).items():
             print(f"    {key}: {value}")
 
-def process_barcode(img_path: str, result_path: str, template_path: str):
+_servers_lock = threading.Lock()
+
+class CircuitState(IntEnum):
+    Closed = 0
+    Open = 1
+    HalfOpen = 2
+
+class ServerUnavailableError(ConnectionError):
+    pass
+
+class ServerHealth:
+    """
+    Background heartbeats plus a circuit breaker for one decode server.
+
+    The last heartbeat result is cached so decodes no longer send their own Heartbeat.
+    After failure_threshold consecutive failures (heartbeats or decodes) the circuit opens and
+    allow_request() returns False, so callers fail fast or switch decoder. After reset_timeout
+    exactly one trial request is let through (others are still refused while it is in flight);
+    a success (or a good heartbeat) closes the circuit again, a failure reopens it.
+    """
+    def __init__(self, server: ProcessingServer, interval: float = 5.0, failure_threshold: int = 3,
+                 reset_timeout: float = 30.0):
+        self.server = server
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.Closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.last_heartbeat: Optional[Dict[str, Any]] = None
+        self.last_heartbeat_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._heartbeat_loop, name="decode-heartbeat", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat_loop(self):
+        while not self._stop.is_set():
+            try:
+                response = self.server.heartbeat()
+                ok = response.get("GenericResult") is not False
+            except Exception:
+                response, ok = None, False
+            self.last_heartbeat = response
+            self.last_heartbeat_at = time.monotonic()
+            if ok:
+                self.record_success()
+            else:
+                self.record_failure()
+            self._stop.wait(self.interval)
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == CircuitState.Open:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = CircuitState.HalfOpen
+            if self.state == CircuitState.HalfOpen:
+                # Only the caller that takes the trial gets through; record_success/failure end it
+                if self.trial_in_flight:
+                    return False
+                self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CircuitState.Closed:
+                print("[DECODE_HEALTH] Decode server back online, circuit closed")
+            self.failures = 0
+            self.state = CircuitState.Closed
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == CircuitState.HalfOpen or (
+                    self.state == CircuitState.Closed and self.failures >= self.failure_threshold):
+                print(f"[DECODE_HEALTH] Decode server failing ({self.failures} in a row), circuit open")
+                self.state = CircuitState.Open
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        True while requests would be refused (does not consume the half-open trial).
+        """
+        with self._lock:
+            if self.state == CircuitState.HalfOpen:
+                return self.trial_in_flight
+            return self.state == CircuitState.Open and time.monotonic() - self.opened_at < self.reset_timeout
+
+_health: Dict[tuple, ServerHealth] = {}
+
+def get_health(server: ProcessingServer, interval: float = 5.0, failure_threshold: int = 3,
+               reset_timeout: float = 30.0) -> ServerHealth:
+    """
+    Return the (started) health monitor shared by every caller of this server.
+    """
+    with _servers_lock:
+        key = (server.host, server.port)
+        if key not in _health:
+            _health[key] = ServerHealth(server, interval, failure_threshold, reset_timeout)
+            _health[key].start()
+        return _health[key]
+
+_servers: Dict[tuple, ProcessingServer] = {}
+
+def get_server(host: str, port: int, framing: str = "close") -> ProcessingServer:
+    """
+    Return the shared client for host:port so repeated decodes reuse one connection.
+    """
+    with _servers_lock:
+        key = (host, port, framing)
+        if key not in _servers:
+            _servers[key] = ProcessingServer(host, port, framing=framing)
+        return _servers[key]
+
+def _run_task(host: str, port: int, framing: str, timeout: float, health_opts: Dict[str, Any], submit) -> Dict[str, Any]:
+    """
+    Submit through the shared client (submit(server) -> response) and wait for completion,
+    failing fast while the circuit is open and recording the outcome on it.
+    """
+    #Reuse one processing server client (and its connection) across calls.
+    server = get_server(host, port, framing)
+
+    #Heartbeats run in the background; fail fast while the circuit is open.
+    health = get_health(server, **health_opts)
+    if not health.allow_request():
+        raise ServerUnavailableError(f"Decode server {host}:{port} unavailable (circuit open)")
+
+    try:
+        response = submit(server)
+        #server.print_response(response)
+        taskId = _require_task_id(response)
+
+        # Wait for the result (server-side wait, else fast adaptive polling).
+        response = server.wait_for_task(taskId, timeout=timeout)
+        #server.print_response(response)
+    except SubmitRejectedError:
+        # The server answered, so it is reachable; the caller sees the rejection at once
+        health.record_success()
+        raise
+    except Exception:
+        health.record_failure()
+        raise
+    health.record_success()
+    return response
+
+def process_barcode(img_path: str, result_path: str, template_path: str,
+                    host: str = "10.40.17.62", port: int = 9000, framing: str = "close",
+                    timeout: float = 30.0, priority: str = "live", return_corners: bool = False, **health_opts):
     #print(img_path)
     #print(result_path)
     #print(template_path)
@@ -112,42 +573,114 @@ def process_barcode(img_path: str, result_path: str, template_path: str):
         print("Template file may be missing (Using relative?):", template_path)
     template_path = str(template_path)
     
-    #Initialize a processing server object to handle requests.
-    server = ProcessingServer("10.40.17.62", 9000)
+    #Submit a photo for processing.
+    # The deadline lets the service drop the task if we have already timed out on it
+    response = _run_task(host, port, framing, timeout, health_opts,
+                         lambda server: server.submit(file_path, template_path, priority, deadline_ms=timeout * 1000))
 
-    #First: heartbeat request
-    response = server.heartbeat()
-    #server.print_response(response)
-    
-    #Make sure heartbeat succeeded.
-    if response.get('GenericResult') == False:
-        print("\nHeartbeat failed! Server offline?")
+    print("\nTask completed.")
+    result_serial = str(response["Results"]["serials"][0])
+    print(result_serial)
+    with open(result_path, "w") as f:
+        f.write(result_serial)
+        
+    if return_corners:
+        return result_serial, result_corners(response)
+    return result_serial
 
-    #Submit a photo for processing.
-    response = server.submit(file_path, template_path)
-    #server.print_response(response)
-    taskId = response.get('TaskId')
-    
-    # Check result.
-    while True:
-        response = server.get_async_task_status(taskId)
-        #server.print_response(response)
 
-        state_val = response.get("State")
-        try:
-            state = TaskState(state_val)
-        except Exception:
-            state = None
+def process_barcode_image(data: bytes, template_path: str, host: str = "10.40.17.62", port: int = 9000,
+                          framing: str = "close", timeout: float = 30.0, priority: str = "live",
+                          encoding: str = "jpeg", name: Optional[str] = None, return_corners: bool = False,
+                          **health_opts):
+    """
+    Decode in-memory image bytes sent inline with the request, so the file share is not on the
+    critical path. Returns the first serial ("-1" if none), or (serial, corners) with return_corners.
+    """
+    response = _run_task(host, port, framing, timeout, health_opts,
+                         lambda server: server.submit_image(data, str(template_path), encoding, name,
+                                                            priority, deadline_ms=timeout * 1000))
+    serials = response.get("Results", {}).get("serials") or ["-1"]
+    if return_corners:
+        return str(serials[0]), result_corners(response)
+    return str(serials[0])
 
-        if state == TaskState.Completed:
-            print("\nTask completed.")
-            result_serial = str(response["Results"]["serials"][0])
-            print(result_serial)
-            with open(result_path, "w") as f:
-                f.write(result_serial)
-            break
 
-        time.sleep(1)
-        
-    return result_serial
-        
+def process_barcode_batch(img_paths: List[str], template_path: str, host: str = "10.40.17.62",
+                          port: int = 9000, framing: str = "close", timeout: float = 600.0,
+                          priority: str = "bulk", max_in_flight: int = 32, poll_start: float = 0.05,
+                          poll_max: float = 2.0, **health_opts) -> List[Optional[str]]:
+    """
+    Decode many images (e.g. a day of failed_links) through batch submits.
+    At most max_in_flight tasks are queued at once (keep it within the server's queue capacity);
+    files the server turns away are resubmitted as earlier tasks finish.
+    Returns one entry per image: the serial, "-1" where the image was decoded but nothing was read,
+    or None where it was never queued, dropped, or did not finish (timeout, or the circuit opened).
+    Raises ServerUnavailableError at once while the circuit is open, like the single-image calls.
+    """
+    server = get_server(host, port, framing)
+    health = get_health(server, **health_opts)
+    if not health.allow_request():
+        raise ServerUnavailableError(f"Decode server {host}:{port} unavailable (circuit open)")
+
+    paths = [str(p) for p in img_paths]
+    serials: List[Optional[str]] = [None] * len(paths)
+    waiting = list(range(len(paths)))       # indexes not yet accepted by the server
+    outstanding: Dict[str, int] = {}        # TaskId -> index
+    deadline = time.monotonic() + timeout
+    interval = poll_start
+    reached = False
+
+    try:
+        while (waiting or outstanding) and time.monotonic() < deadline:
+            if reached and health.is_open:
+                # Heartbeats or other callers found the server down; stop instead of polling to the deadline
+                print(f"[DECODE] Batch: decode server {host}:{port} went down, stopping")
+                break
+            progress = False
+            room = max_in_flight - len(outstanding)
+            if waiting and room > 0:
+                chunk, waiting = waiting[:room], waiting[room:]
+                task_ids = server.submit_batch([paths[i] for i in chunk], str(template_path), priority)
+                rejected = []
+                for i, tid in zip(chunk, task_ids):
+                    if tid:
+                        outstanding[tid] = i
+                        progress = True
+                    else:
+                        rejected.append(i)
+                waiting = rejected + waiting
+                if not reached:
+                    # The server answered: close the circuit (or end the half-open trial) now,
+                    # not after the whole bulk run
+                    reached = True
+                    health.record_success()
+
+            if outstanding:
+                for tid, response in server.get_batch_status(list(outstanding)).items():
+                    if tid not in outstanding or _task_state(response) != TaskState.Completed:
+                        continue
+                    i = outstanding.pop(tid)
+                    progress = True
+                    # Dropped or failed tasks were never decoded; leave them None rather than report a miss
+                    if response.get("Expired") or response.get("Cancelled") or response.get("GenericResult") is False:
+                        continue
+                    found = response.get("Results", {}).get("serials") or []
+                    serials[i] = str(found[0]) if found else "-1"
+
+            if waiting or outstanding:
+                interval = poll_start if progress else min(interval * 1.5, poll_max)
+                time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+    except Exception:
+        health.record_failure()
+        raise
+
+    if not health.is_open:
+        for tid in outstanding:
+            try:
+                server.cancel_async_task(tid)
+            except Exception:
+                pass
+    if waiting or outstanding:
+        print(f"[DECODE] Batch: {len(waiting)} image(s) never queued, {len(outstanding)} unfinished")
+    return serials
@@ -0,0 +1,127 @@
+# Frame Quality Checks
+# Author: Sujai Rajan
+# Works with serial_linker_robot.py and config.json
+#
+# Fast checks on a downscaled copy of a camera frame, run before any JPEG
+# encoding or network write. Replaces the old "file must be > 500 KB" check.
+#
+# Every check is measured and logged, but only the reasons listed in "reject"
+# fail a frame. By default that is just "dark" (a dropped / black frame); the
+# brightness, clipping and focus limits are not calibrated per station yet, so
+# a station opts into them once it has, e.g.
+#
+#   "reject": ["dark", "underexposed", "overexposed", "clipped", "blurred"]
+
+import time
+import cv2
+
+
+DEFAULTS = {
+    "analyze_max_side": 640,     # longest side of the downscaled copy
+    "dark_mean": 5,              # mean below this is a black / dropped frame
+    "min_mean": 30,
+    "max_mean": 230,
+    "clip_level": 250,           # 8-bit value treated as blown out
+    "max_clipped_ratio": 0.25,
+    "min_focus": 40.0,           # Laplacian variance over the ROI
+    "reject": ["dark"],          # reasons that fail a frame; the others are only reported
+}
+
+
+# ---------- ROI / Focus Helpers ----------
+def crop_roi(frame, roi):
+    """Crop a normalized [x, y, w, h] region (0..1) out of a frame; full frame if roi is None."""
+    if not roi:
+        return frame
+    h, w = frame.shape[:2]
+    x0, y0 = int(roi[0] * w), int(roi[1] * h)
+    x1, y1 = int((roi[0] + roi[2]) * w), int((roi[1] + roi[3]) * h)
+    x0, y0 = max(0, x0), max(0, y0)
+    x1, y1 = min(w, x1), min(h, y1)
+    if x1 <= x0 or y1 <= y0:
+        return frame
+    return frame[y0:y1, x0:x1]
+
+
+def expand_roi(roi, margin):
+    """Grow a normalized [x, y, w, h] ROI by `margin` (fraction of its own size) on every side, clamped to the frame."""
+    if not roi:
+        return None
+    x, y, w, h = roi
+    x0, y0 = max(0.0, x - w * margin), max(0.0, y - h * margin)
+    x1, y1 = min(1.0, x + w * (1 + margin)), min(1.0, y + h * (1 + margin))
+    return [x0, y0, x1 - x0, y1 - y0]
+
+
+def _gray_small(img, max_side):
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    scale = max_side / max(img.shape[:2])
+    if scale < 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def sharpness_score(frame, roi=None, max_side=800):
+    """Laplacian variance of the (downscaled, grayscale) barcode ROI. Higher is sharper."""
+    return cv2.Laplacian(_gray_small(crop_roi(frame, roi), max_side), cv2.CV_64F).var()
+
+
+# ---------- Verdict ----------
+class FrameVerdict:
+    """Result of analyze(): the measured values, every limit the frame broke (`reasons`) and
+    the ones that reject it (`rejected_for`). `ok` means nothing rejected it."""
+
+    def __init__(self, mean, clipped_ratio, focus, reasons, elapsed_ms, reject=("dark",)):
+        self.mean = mean
+        self.clipped_ratio = clipped_ratio
+        self.focus = focus
+        self.reasons = reasons
+        self.rejected_for = [r for r in reasons if r in reject]
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def ok(self):
+        return not self.rejected_for
+
+    @property
+    def dark(self):
+        return "dark" in self.reasons
+
+    def __repr__(self):
+        state = "OK" if self.ok else "REJECT(" + ", ".join(self.rejected_for) + ")"
+        if self.ok and self.reasons:
+            state += "(" + ", ".join(self.reasons) + ")"
+        return (f"FrameVerdict({state}, mean={self.mean:.1f}, clipped={self.clipped_ratio:.3f}, "
+                f"focus={self.focus:.1f}, {self.elapsed_ms:.1f} ms)")
+
+
+def analyze(frame, roi=None, cfg=None):
+    """Score brightness, clipping and focus on a downscaled copy of `frame` and return a FrameVerdict."""
+    t_start = time.perf_counter()
+    limits = dict(DEFAULTS)
+    limits.update(cfg or {})
+
+    small = _gray_small(frame, limits["analyze_max_side"])
+    mean = float(small.mean())
+    clipped_ratio = float((small >= limits["clip_level"]).mean())
+
+    reasons = []
+    if mean < limits["dark_mean"]:
+        # Nothing else is meaningful on a black frame
+        focus = 0.0
+        reasons.append("dark")
+    else:
+        roi_small = _gray_small(crop_roi(frame, roi), limits["analyze_max_side"]) if roi else small
+        focus = float(cv2.Laplacian(roi_small, cv2.CV_64F).var())
+        if mean < limits["min_mean"]:
+            reasons.append("underexposed")
+        if mean > limits["max_mean"]:
+            reasons.append("overexposed")
+        if clipped_ratio > limits["max_clipped_ratio"]:
+            reasons.append("clipped")
+        if focus < limits["min_focus"]:
+            reasons.append("blurred")
+
+    return FrameVerdict(mean, clipped_ratio, focus, reasons, (time.perf_counter() - t_start) * 1000,
+                        limits["reject"])
@@ -0,0 +1,38 @@
+# Small JSON Stores
+# Author: Sujai Rajan
+# Works with roi_learning.py, decode_cache.py and barcode_decoder.py
+#
+# Load / save helpers for the little JSON files the HMI keeps across restarts
+# (learned ROIs, decode cache, template tier memory). Writes go to a temp file
+# that replaces the store in one step, so a crash never leaves half a file.
+# Failures are printed, never raised: losing one of these only costs speed.
+
+import os
+import json
+
+
+def load_json(path, default, tag, what):
+    """Contents of the JSON file at `path`, or `default` if there is no path, no file or it is unreadable."""
+    if not path:
+        return default
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        print(f"[{tag}] Could not read {what}, starting empty:", e)
+        return default
+
+
+def save_json(path, data, tag, what):
+    """Atomically replace the JSON file at `path` with `data` (no-op without a path)."""
+    if not path:
+        return
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[{tag}] Could not write {what}:", e)
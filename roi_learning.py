@@ -0,0 +1,95 @@
+# Barcode ROI Learning
+# Author: Sujai Rajan
+# Works with serial_linker_robot.py and config.json
+#
+# Records where the DataMatrix was found on each successful decode (per board
+# and side) and turns that history into a tight ROI, so boards do not need a
+# hand-tuned left_roi / right_roi in config.json. Stored as a small JSON file.
+
+import os
+import threading
+from statistics import median
+
+from json_store import load_json, save_json
+
+
+class RoiLearner:
+    """Running, outlier-filtered bounding box of decoded barcode corners per board/side.
+    All coordinates are normalized (0..1) to the full camera frame."""
+
+    def __init__(self, path, history=50, min_samples=5, outlier_k=3.0, miss_growth=0.5, max_misses=2):
+        self.path = os.path.expanduser(path)
+        self.history = history
+        self.min_samples = min_samples
+        self.outlier_k = outlier_k
+        self.miss_growth = miss_growth
+        self.max_misses = max_misses
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    # ---------- Store ----------
+    def _load(self):
+        return load_json(self.path, {}, "ROI_LEARNING", "ROI store")
+
+    def _save(self):
+        save_json(self.path, self._data, "ROI_LEARNING", "ROI store")
+
+    def _entry(self, board, side):
+        return self._data.setdefault(f"{board}/{side}", {"boxes": [], "misses": 0})
+
+    # ---------- Updates ----------
+    def record_hit(self, board, side, points):
+        """Record a successful decode. `points` are the barcode corners as normalized (x, y) pairs."""
+        points = [(x, y) for x, y in points if 0.0 <= x <= 1.0 and 0.0 <= y <= 1.0]
+        if len(points) < 4:
+            return
+        xs, ys = [p[0] for p in points], [p[1] for p in points]
+        with self._lock:
+            entry = self._entry(board, side)
+            entry["boxes"].append([min(xs), min(ys), max(xs), max(ys)])
+            entry["boxes"] = entry["boxes"][-self.history:]
+            entry["misses"] = 0
+            self._save()
+
+    def record_miss(self, board, side):
+        """Record a decode miss; the next ROI for this board/side is widened, then dropped to full frame."""
+        with self._lock:
+            entry = self._entry(board, side)
+            entry["misses"] += 1
+            self._save()
+
+    # ---------- Query ----------
+    def _inliers(self, boxes):
+        """Drop boxes whose centre is far (k * MAD) from the median centre."""
+        cx = [(b[0] + b[2]) / 2 for b in boxes]
+        cy = [(b[1] + b[3]) / 2 for b in boxes]
+        mx, my = median(cx), median(cy)
+        # Floor on MAD so a very consistent history does not reject everything that moves a pixel
+        mad_x = max(median(abs(v - mx) for v in cx), 0.005)
+        mad_y = max(median(abs(v - my) for v in cy), 0.005)
+        return [b for b, x, y in zip(boxes, cx, cy)
+                if abs(x - mx) <= self.outlier_k * mad_x and abs(y - my) <= self.outlier_k * mad_y]
+
+    def roi(self, board, side):
+        """Learned [x, y, w, h] for this board/side, or None (use full frame) if not enough history
+        or too many misses in a row."""
+        with self._lock:
+            entry = self._data.get(f"{board}/{side}")
+            if not entry or len(entry["boxes"]) < self.min_samples:
+                return None
+            if entry["misses"] > self.max_misses:
+                return None
+            boxes = self._inliers(entry["boxes"]) or entry["boxes"]
+            misses = entry["misses"]
+
+        x0 = min(b[0] for b in boxes)
+        y0 = min(b[1] for b in boxes)
+        x1 = max(b[2] for b in boxes)
+        y1 = max(b[3] for b in boxes)
+        w, h = x1 - x0, y1 - y0
+
+        # Widen after each consecutive miss
+        grow = misses * self.miss_growth
+        x0, y0 = max(0.0, x0 - w * grow), max(0.0, y0 - h * grow)
+        x1, y1 = min(1.0, x1 + w * grow), min(1.0, y1 + h * grow)
+        return [x0, y0, x1 - x0, y1 - y0]
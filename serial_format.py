@@ -0,0 +1,96 @@
+# Serial Number Format Rules
+# Author: Sujai Rajan
+# Works with barcode_decoder.py, test_gui.py and config.json
+#
+# Per-board rules for what a decoded serial may look like, so a misread is
+# rejected on the spot instead of costing an MES round trip and a failed link.
+# Configured per board in config.json, e.g.
+#
+#   "serial_format": {"length": [10, 12], "charset": "A-Z0-9", "prefix": ["SL", "SN"], "checksum": "luhn"}
+#
+# Every key is optional. checksum is one of "luhn", "gs1" (mod 10, 3-1 weights) or "mod43".
+
+import re
+
+
+MOD43_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-. $/+%"
+
+
+# ---------- Checksums ----------
+def _luhn_ok(text):
+    if not text.isdigit():
+        return False
+    total = 0
+    for i, ch in enumerate(reversed(text)):
+        d = int(ch)
+        if i % 2 == 1:
+            d = d * 2 - 9 if d > 4 else d * 2
+        total += d
+    return total % 10 == 0
+
+
+def _gs1_ok(text):
+    if not text.isdigit() or len(text) < 2:
+        return False
+    body, check = text[:-1], int(text[-1])
+    total = sum(int(ch) * (3 if i % 2 == 0 else 1) for i, ch in enumerate(reversed(body)))
+    return (10 - total % 10) % 10 == check
+
+
+def _mod43_ok(text):
+    if len(text) < 2 or any(ch not in MOD43_CHARS for ch in text):
+        return False
+    return sum(MOD43_CHARS.index(ch) for ch in text[:-1]) % 43 == MOD43_CHARS.index(text[-1])
+
+
+CHECKSUMS = {"luhn": _luhn_ok, "gs1": _gs1_ok, "mod43": _mod43_ok}
+
+
+# ---------- Format ----------
+class SerialFormat:
+    """Length, character set, prefix and checksum rules for one board's serials."""
+
+    def __init__(self, length=None, charset=None, prefix=None, checksum=None):
+        if isinstance(length, int):
+            length = [length, length]
+        if checksum and checksum not in CHECKSUMS:
+            raise ValueError(f"Unknown serial checksum: {checksum}")
+        self.length = length
+        self.charset = re.compile(f"[{charset}]+") if charset else None
+        self.prefix = tuple([prefix] if isinstance(prefix, str) else prefix or ())
+        self.checksum = checksum
+
+    def check(self, text):
+        """None if `text` is a valid serial, else the reason it was rejected."""
+        if self.length and not self.length[0] <= len(text) <= self.length[1]:
+            return f"length {len(text)} not in {self.length[0]}..{self.length[1]}"
+        if self.charset and not self.charset.fullmatch(text):
+            return "unexpected characters"
+        if self.prefix and not text.startswith(self.prefix):
+            return f"prefix not one of {', '.join(self.prefix)}"
+        if self.checksum and not CHECKSUMS[self.checksum](text):
+            return f"{self.checksum} checksum failed"
+        return None
+
+
+class SerialRules:
+    """SerialFormat per board, built from the "serial_format" entry of each board's config."""
+
+    def __init__(self, formats=None):
+        self.formats = formats or {}
+
+    @classmethod
+    def from_config(cls, cfg):
+        formats = {}
+        for board, board_cfg in cfg.items():
+            if isinstance(board_cfg, dict) and board_cfg.get("serial_format"):
+                try:
+                    formats[board] = SerialFormat(**board_cfg["serial_format"])
+                except (TypeError, ValueError, re.error) as e:
+                    print(f"[CONFIG_UPDATE] Ignoring serial_format for {board}: {e}")
+        return cls(formats)
+
+    def check(self, text, board):
+        """None if `text` is acceptable for `board` (or the board has no rules), else the reason."""
+        fmt = self.formats.get(board)
+        return fmt.check(text) if fmt else None
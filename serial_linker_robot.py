@@ -7,7 +7,13 @@ import json
 import os
 import cv2
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pymycobot.mycobot320 import MyCobot320
+from frame_quality import analyze as analyze_frame, sharpness_score, crop_roi, expand_roi
+from roi_learning import RoiLearner
 
 
 
@@ -70,8 +76,9 @@ def set_board(board_name):
 mc = None
 
 def init_robot(existing=None):
-    """Attach an existing MyCobot320 instance or create a new one once."""
+    """Attach an existing MyCobot320 instance or create a new one once. Also opens the camera session."""
     global mc
+    init_camera()
     try: 
         if existing:
             mc = existing
@@ -93,82 +100,480 @@ def init_robot(existing=None):
         mc = None
         return None
 
-# ---------- Camera Init ----------
-def capture_image(side):
-    """Capture a stable, non-black image; retry automatically if dark or too small."""
-    
-    # --- Choose backend ---
-    if cam_cfg["use_gst"]:
-        print("Using GStreamer pipeline for camera")
-        gst = (f"v4l2src device=/dev/video0 ! "
-               f"image/jpeg, width={cam_cfg['resolution'][0]}, height={cam_cfg['resolution'][1]}, framerate={cam_cfg['fps']}/1 ! "
-               "jpegdec ! videoconvert ! appsink")
-        cap = cv2.VideoCapture(gst, cv2.CAP_GSTREAMER)
-        
-    else:
-        cap = cv2.VideoCapture(cam_cfg["camera_index"], cv2.CAP_V4L2)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, cam_cfg["resolution"][0])
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, cam_cfg["resolution"][1])
-        cap.set(cv2.CAP_PROP_FPS, cam_cfg["fps"])
-        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*cam_cfg["camera_format"]))
-        cap.set(cv2.CAP_PROP_BRIGHTNESS, cam_cfg["controls"]["brightness"]["value"])
-        cap.set(cv2.CAP_PROP_CONTRAST, cam_cfg["controls"]["contrast"]["value"])
-        cap.set(cv2.CAP_PROP_SATURATION, cam_cfg["controls"]["saturation"]["value"])
-        cap.set(cv2.CAP_PROP_HUE, cam_cfg["controls"]["hue"]["value"])
-        cap.set(cv2.CAP_PROP_GAMMA, cam_cfg["controls"]["gamma"]["value"])
-        cap.set(cv2.CAP_PROP_SHARPNESS, cam_cfg["controls"]["sharpness"]["value"])
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-
-    # --- Debug info ---
-    if cam_cfg["debug_cam"] and LOGGING_TOGGLE:
-        logger.warning(f"Camera Properties: "
-                       f"{cap.get(cv2.CAP_PROP_FRAME_WIDTH)}x{cap.get(cv2.CAP_PROP_FRAME_HEIGHT)} "
-                       f"at {cap.get(cv2.CAP_PROP_FPS)} FPS")
-
-    # --- Stabilize and flush buffer ---
-    time.sleep(0.5)
-    for _ in range(3):
-        cap.read()
-        time.sleep(0.05)
+# ---------- Camera Session ----------
+class CameraSession:
+    """Long-lived camera handle: opened once, controls applied once, frames read on demand."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.cap = None
+        self._lock = threading.Lock()
+
+        # --- Background grabber state ---
+        self.frame_interval = 1.0 / max(cfg.get("fps", 15), 1)
+        self.frames = deque(maxlen=cfg.get("ring_buffer_size", 3))
+        self._frames_cond = threading.Condition()
+        self._streaming = threading.Event()
+        self._stop = threading.Event()
+        self._grab_thread = None
+
+    def open(self):
+        """Open the device and apply format/controls. Safe to call again after release()."""
+        with self._lock:
+            if self.cap is not None and self.cap.isOpened():
+                return True
+
+            # --- Choose backend ---
+            if self.cfg["use_gst"]:
+                print("Using GStreamer pipeline for camera")
+                gst = (f"v4l2src device=/dev/video0 ! "
+                       f"image/jpeg, width={self.cfg['resolution'][0]}, height={self.cfg['resolution'][1]}, framerate={self.cfg['fps']}/1 ! "
+                       "jpegdec ! videoconvert ! appsink")
+                cap = cv2.VideoCapture(gst, cv2.CAP_GSTREAMER)
 
-    file_path = os.path.join(cam_cfg["save_path"], f"{side}_image.jpg")
+            else:
+                cap = cv2.VideoCapture(self.cfg["camera_index"], cv2.CAP_V4L2)
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.cfg["resolution"][0])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.cfg["resolution"][1])
+                cap.set(cv2.CAP_PROP_FPS, self.cfg["fps"])
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.cfg["camera_format"]))
+                cap.set(cv2.CAP_PROP_BRIGHTNESS, self.cfg["controls"]["brightness"]["value"])
+                cap.set(cv2.CAP_PROP_CONTRAST, self.cfg["controls"]["contrast"]["value"])
+                cap.set(cv2.CAP_PROP_SATURATION, self.cfg["controls"]["saturation"]["value"])
+                cap.set(cv2.CAP_PROP_HUE, self.cfg["controls"]["hue"]["value"])
+                cap.set(cv2.CAP_PROP_GAMMA, self.cfg["controls"]["gamma"]["value"])
+                cap.set(cv2.CAP_PROP_SHARPNESS, self.cfg["controls"]["sharpness"]["value"])
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+            if not cap.isOpened():
+                if LOGGING_TOGGLE: logger.error("Camera could not be opened")
+                cap.release()
+                return False
+
+            # --- Debug info ---
+            if self.cfg["debug_cam"] and LOGGING_TOGGLE:
+                logger.warning(f"Camera Properties: "
+                               f"{cap.get(cv2.CAP_PROP_FRAME_WIDTH)}x{cap.get(cv2.CAP_PROP_FRAME_HEIGHT)} "
+                               f"at {cap.get(cv2.CAP_PROP_FPS)} FPS")
+
+            # --- Let exposure settle once, not per capture ---
+            time.sleep(0.5)
+            for _ in range(3):
+                cap.read()
+
+            self.cap = cap
+            if LOGGING_TOGGLE: logger.warning("Camera session opened")
+            return True
+
+    def is_open(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        """Return (ret, frame) from the open stream, opening it first if needed."""
+        if not self.is_open() and not self.open():
+            return False, None
+        with self._lock:
+            return self.cap.read()
+
+    def flush(self, count=2):
+        """Drop frames queued while the arm was moving."""
+        for _ in range(count):
+            self.read()
+
+    def reopen(self):
+        self.release()
+        return self.open()
+
+    def release(self):
+        self.stop_grabber()
+        with self._lock:
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+
+    # ---------- Background Grabber ----------
+    def start_grabber(self):
+        """Start the thread that keeps the V4L2 queue drained and fills the ring buffer."""
+        if self.grabber_running():
+            return
+        self._stop.clear()
+        self._grab_thread = threading.Thread(target=self._grab_loop, name="camera-grabber", daemon=True)
+        self._grab_thread.start()
+
+    def stop_grabber(self):
+        self._stop.set()
+        if self._grab_thread is not None and self._grab_thread is not threading.current_thread():
+            self._grab_thread.join(timeout=2)
+        self._grab_thread = None
+
+    def grabber_running(self):
+        return self._grab_thread is not None and self._grab_thread.is_alive()
+
+    def set_streaming(self, on):
+        """Decode frames into the ring buffer only while a capture is waiting.
+        When off, the grabber still grab()s every frame so the driver queue never goes stale."""
+        if on:
+            self._streaming.set()
+        else:
+            self._streaming.clear()
+            with self._frames_cond:
+                self.frames.clear()
+
+    def _grab_loop(self):
+        while not self._stop.is_set():
+            if not self.is_open():
+                time.sleep(0.2)
+                continue
+            frame = None
+            with self._lock:
+                if self.cap is None:
+                    continue
+                ok = self.cap.grab()
+                stamp = time.monotonic()
+                if ok and self._streaming.is_set():
+                    ok, frame = self.cap.retrieve()
+            if not ok:
+                time.sleep(0.05)
+                continue
+            if frame is not None:
+                with self._frames_cond:
+                    self.frames.append((stamp, frame))
+                    self._frames_cond.notify_all()
+
+    def wait_for_frame(self, after, timeout=2.0, newer=False):
+        """Return (stamp, frame) for the first buffered frame exposed after `after` (time.monotonic()).
+        A frame is only trusted if it finished one full frame interval after `after`. With `newer`,
+        `after` is the stamp of a previous frame and any later frame will do (grab jitter can make
+        consecutive frames slightly less than one interval apart)."""
+        deadline = time.monotonic() + timeout
+        with self._frames_cond:
+            while True:
+                for stamp, frame in self.frames:
+                    if (stamp > after) if newer else (stamp - self.frame_interval >= after):
+                        return stamp, frame
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, None
+                self._frames_cond.wait(remaining)
+
+
+camera = None
+
+def init_camera():
+    """Create and open the shared camera session once."""
+    global camera
+    if camera is None:
+        camera = CameraSession(cam_cfg)
+    try:
+        if not camera.open():
+            print("[ERROR] Camera session could not be opened")
+        elif cam_cfg.get("use_grabber", True):
+            camera.start_grabber()
+    except Exception as e:
+        print("[ERROR] Could not open camera:", e)
+    return camera
+
+def release_camera():
+    global camera
+    if camera is not None:
+        camera.release()
+        camera = None
+
+
+# ---------- Camera Capture ----------
+def _next_frame(cam, after, newer=False):
+    """Return (stamp, frame) newer than `after`, from the ring buffer if the grabber is running.
+    `newer`: `after` is a previous frame's stamp rather than the time the arm settled."""
+    if cam.grabber_running():
+        return cam.wait_for_frame(after, cam_cfg.get("frame_timeout_sec", 2.0), newer)
+
+    # --- Fallback without grabber: flush frames buffered during the move ---
+    cam.flush()
+    ret, frame = cam.read()
+    return (time.monotonic(), frame) if ret else (None, None)
+
+
+# ---------- Barcode ROI ----------
+roi_cfg = config.get("roi_learning", {})
+roi_learner = None
+if roi_cfg.get("enabled", False):
+    roi_learner = RoiLearner(roi_cfg.get("store_path", "~/roi_store.json"),
+                             history=roi_cfg.get("history", 50),
+                             min_samples=roi_cfg.get("min_samples", 5),
+                             miss_growth=roi_cfg.get("miss_growth", 0.5),
+                             max_misses=roi_cfg.get("max_misses", 2))
+
+def board_roi(side):
+    """Normalized [x, y, w, h] where the DataMatrix lands for the current board/side, or None for full frame.
+    A hand-set left_roi/right_roi in config wins over the learned one."""
+    roi = current_board_cfg.get(f"{side}_roi")
+    if roi is None and roi_learner is not None:
+        roi = roi_learner.roi(current_board_name, side)
+    return roi
+
+def learn_roi(capture, points_px):
+    """Feed decoded barcode corners (pixels in the decoded crop) back into the ROI learner."""
+    if roi_learner is None or capture is None:
+        return
+    roi_learner.record_hit(current_board_name, capture.side, capture.to_frame_norm(points_px))
+
+def learn_roi_miss(side):
+    if roi_learner is not None:
+        roi_learner.record_miss(current_board_name, side)
+
+
+# ---------- Sharpness Gate ----------
+def _next_sharp_frame(cam, after, side, newer=False):
+    """Score consecutive frames and return the first one once sharpness has plateaued (vibration died down).
+    Falls back to the sharpest frame seen if the gate times out."""
+    gate_cfg = cam_cfg.get("sharpness_gate", {})
+    plateau_tol = gate_cfg.get("plateau_tolerance", 0.05)
+    plateau_frames = gate_cfg.get("plateau_frames", 2)
+    timeout = gate_cfg.get("timeout_sec", 1.5)
+    roi = board_roi(side)
+
+    t_start = time.monotonic()
+    best = (None, None, -1.0)
+    prev_score = None
+    plateau = 0
+    while time.monotonic() - t_start < timeout:
+        stamp, frame = _next_frame(cam, after, newer)
+        if frame is None:
+            break
+        # Following frames only need to be newer than this one, not a full interval after it
+        after, newer = stamp, True
+        score = sharpness_score(frame, roi)
+        if score > best[2]:
+            best = (stamp, frame, score)
+
+        if prev_score is not None and abs(score - prev_score) <= plateau_tol * max(prev_score, 1e-6):
+            plateau += 1
+        else:
+            plateau = 0
+        prev_score = score
 
-    # --- Capture attempts with validation ---
-    for attempt in range(3):
-        ret, frame = cap.read()
-        if not ret or frame is None:
+        # Plateau reached and not on the way down from a sharper frame
+        if plateau >= plateau_frames and score >= best[2] * (1 - plateau_tol):
             if LOGGING_TOGGLE:
-                logger.warning(f"{side}: Capture failed on attempt {attempt+1}, retrying...")
-            time.sleep(0.3)
-            continue
+                logger.warning(f"{side}: Sharpness plateau {score:.1f} after {time.monotonic() - t_start:.2f}s")
+            return stamp, frame
+
+    if LOGGING_TOGGLE:
+        logger.warning(f"{side}: Sharpness gate timed out, using best frame ({best[2]:.1f})")
+    return best[0], best[1]
+
+
+# ---------- Cycle Timeline ----------
+class CycleTimeline:
+    """Start/end times (perf_counter) of each stage in one cycle, to show how much work overlaps the motion."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def mark(self, name, start, end=None):
+        with self._lock:
+            self.stages.append((name, start, end if end is not None else time.perf_counter()))
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name, start)
+
+    def summary(self):
+        """One line per stage (offsets from cycle start) plus how many seconds of work ran in parallel."""
+        with self._lock:
+            stages = sorted(self.stages, key=lambda st: st[1])
+        if not stages:
+            return "no stages"
+        span = max(st[2] for st in stages) - min(st[1] for st in stages)
+        busy = sum(st[2] - st[1] for st in stages)
+        lines = [f"{name:<14} {start - self.t0:6.2f}s -> {end - self.t0:6.2f}s ({end - start:.2f}s)"
+                 for name, start, end in stages]
+        lines.append(f"wall={span:.2f}s, stage_sum={busy:.2f}s, overlapped={max(0.0, busy - span):.2f}s")
+        return "\n".join(lines)
+
+
+last_timeline = None
+
+
+# ---------- Capture Result ----------
+_save_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-save")
+_callback_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-callback")
+
+class CaptureResult:
+    """A captured frame held in memory. JPEG encoding is lazy and the disk write runs in the background,
+    so decoding and the next robot move never wait on the network share."""
+
+    def __init__(self, side, frame, stamp, path, roi=None, timeline=None, board=None):
+        self.side = side
+        self.board = board
+        self.timeline = timeline
+        self.frame = frame
+        self.stamp = stamp
+        self.path = path
+        self.roi = roi
+        # ROI crop (with margin) is what gets encoded, saved and decoded; full frame kept for fallbacks
+        self.crop = crop_roi(frame, roi)
+        self._jpeg = None
+        self._jpeg_lock = threading.Lock()
+        self._save_future = None
+        self.quality = None
+
+    def to_frame_norm(self, points_px):
+        """Map pixel (x, y) points in the crop back to normalized full-frame coordinates."""
+        fh, fw = self.frame.shape[:2]
+        rx, ry = (self.roi[0], self.roi[1]) if self.roi else (0.0, 0.0)
+        # crop_roi() truncates to whole pixels, so use the actual crop origin
+        ox, oy = max(0, int(rx * fw)), max(0, int(ry * fh))
+        return [((ox + x) / fw, (oy + y) / fh) for x, y in points_px]
+
+    def jpeg(self):
+        """Encoded JPEG bytes of the ROI crop, encoded once on first use."""
+        with self._jpeg_lock:
+            if self._jpeg is None:
+                ok, buf = cv2.imencode(".jpg", self.crop)
+                self._jpeg = buf.tobytes() if ok else b""
+            return self._jpeg
+
+    def save_async(self):
+        if self._save_future is None:
+            self._save_future = _save_pool.submit(self._save)
+        return self._save_future
+
+    def _save(self):
+        t_start = time.perf_counter()
+        data = self.jpeg()
+        if self.timeline:
+            self.timeline.mark(f"encode_{self.side}", t_start)
+        t_write = time.perf_counter()
+        if not data:
+            if LOGGING_TOGGLE: logger.error(f"{self.side}: JPEG encode failed, image not saved")
+            return None
+        with open(self.path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.timeline:
+            self.timeline.mark(f"save_{self.side}", t_write)
+        if LOGGING_TOGGLE: logger.warning("Saved %s image to %s", self.side, self.path)
+        return self.path
+
+    def wait_saved(self, timeout=None):
+        """Block until the background save finishes; returns the path or None if it failed."""
+        try:
+            return self.save_async().result(timeout)
+        except Exception as e:
+            print(f"[ERROR] Saving {self.side} image failed:", e)
+            return None
+
+
+def capture_frame(side, settled_at=None, sharp_gate=None, timeline=None):
+    """Capture a frame that passes the quality check, taken after `settled_at` (time.monotonic()) and return a CaptureResult.
+    The image is validated in memory and saved in the background. If every attempt is rejected for something other
+    than darkness the best frame is returned anyway, with its verdict in .quality; None if no usable frame came back.
+    With `sharp_gate` (default camera.sharpness_gate.enabled) the frame is held until ROI sharpness plateaus."""
+
+    cam = camera or init_camera()
+    if settled_at is None:
+        settled_at = time.monotonic()
+    if sharp_gate is None:
+        sharp_gate = cam_cfg.get("sharpness_gate", {}).get("enabled", False)
+
+    file_path = os.path.join(cam_cfg["save_path"], f"{side}_image.jpg")
+
+    best = None     # (verdict, stamp, frame) of the least bad rejected frame
+    newer = False   # settled_at is a settle time until a frame has been taken
+    cam.set_streaming(True)
+    try:
+        # --- Capture attempts with validation ---
+        for attempt in range(3):
+            if sharp_gate:
+                stamp, frame = _next_sharp_frame(cam, settled_at, side, newer)
+            else:
+                stamp, frame = _next_frame(cam, settled_at, newer)
+            if frame is None:
+                if LOGGING_TOGGLE:
+                    logger.warning(f"{side}: Capture failed on attempt {attempt+1}, reopening camera...")
+                cam.reopen()
+                if cam_cfg.get("use_grabber", True):
+                    cam.start_grabber()
+                settled_at, newer = time.monotonic(), False
+                continue
 
-        # Check brightness to avoid black frame
-        if frame.mean() < 5:
-            if LOGGING_TOGGLE:
-                logger.warning(f"{side}: Dark frame detected (mean={frame.mean():.2f}), retrying...")
-            time.sleep(0.3)
-            continue
-
-        # Save image and verify size
-        cv2.imwrite(file_path, frame)
-        size_kb = os.path.getsize(file_path) / 1024
-        if size_kb < 500:
             if LOGGING_TOGGLE:
-                logger.warning(f"{side}: Small file ({size_kb:.1f} KB), retrying...")
-            time.sleep(0.3)
-            continue
+                logger.warning(f"{side}: Frame latency after settle {stamp - settled_at:.3f}s")
+            # Any retry must use a newer frame than this one
+            settled_at, newer = stamp, True
 
-        # Valid capture
-        if LOGGING_TOGGLE:
-            logger.warning(f"{side}: Capture OK ({size_kb:.1f} KB, mean={frame.mean():.1f})")
-        cap.release()
-        return file_path
+            # Fast quality check on a downscaled copy, before any encoding
+            verdict = analyze_frame(frame, board_roi(side), cam_cfg.get("quality"))
+            if not verdict.ok:
+                if LOGGING_TOGGLE:
+                    logger.warning(f"{side}: Frame rejected {verdict}, retrying...")
+                if best is None or _frame_rank(verdict) < _frame_rank(best[0]):
+                    best = (verdict, stamp, frame)
+                continue
+
+            # Valid capture
+            if LOGGING_TOGGLE:
+                logger.warning(f"{side}: Capture OK {verdict}")
+            return _capture_result(side, frame, stamp, file_path, timeline, verdict)
+    finally:
+        cam.set_streaming(False)
 
     # --- If all attempts failed ---
+    if best is None or best[0].dark:
+        # No frame, or only black ones: a camera / lighting fault, not something a decode can fix
+        if LOGGING_TOGGLE:
+            reason = "no frame from the camera" if best is None else f"dark frames only, best {best[0]}"
+            logger.error(f"{side}: Capture failed after 3 attempts ({reason}).")
+        return None
+    # Only non-dark limits rejected it: still decode (and save, for review) the best frame
+    verdict, stamp, frame = best
     if LOGGING_TOGGLE:
-        logger.error(f"{side}: Capture failed after 3 attempts (black/small image).")
-    cap.release()
-    return None
+        logger.error(f"{side}: No frame passed the quality check in 3 attempts, using the best one {verdict}")
+    return _capture_result(side, frame, stamp, file_path, timeline, verdict)
+
+
+def _frame_rank(verdict):
+    """Sort key for rejected frames: black frames last, then fewer rejections, sharper, brighter."""
+    return verdict.dark, len(verdict.rejected_for), -verdict.focus, -verdict.mean
+
+
+def _capture_result(side, frame, stamp, file_path, timeline, verdict):
+    roi = expand_roi(board_roi(side), cam_cfg.get("roi_margin", 0.25))
+    result = CaptureResult(side, frame, stamp, file_path, roi, timeline, current_board_name)
+    result.quality = verdict
+    result.save_async()
+    return result
+
+
+def dispatch_image(callback, capture, side):
+    """Hand a capture to the caller's callback on a worker thread so the next move starts immediately."""
+    if not callback:
+        return None
+
+    def _run():
+        try:
+            callback(capture)
+        except Exception as e:
+            if LOGGING_TOGGLE:
+                logger.warning("%s image callback failed: %s", side.capitalize(), e)
+            else:
+                print(f"[WARN] {side.capitalize()} image callback failed:", e)
+
+    return _callback_pool.submit(_run)
+
+
+def capture_image(side, settled_at=None, sharp_gate=None):
+    """Capture and save an image; returns the saved file path (or None). Kept for callers that need a file."""
+    result = capture_frame(side, settled_at=settled_at, sharp_gate=sharp_gate)
+    return result.wait_saved() if result else None
 
 
 # ---------- IO Control ----------
@@ -269,20 +674,124 @@ def wait_for_trigger():
 def go_home():
     if LOGGING_TOGGLE: logger.warning("Moving to home position")
     mc.send_angles(robot_cfg["home_pose"], robot_cfg["speed"])
+    return robot_cfg["home_pose"]
 
 def go_left():
     if LOGGING_TOGGLE: logger.warning("Moving to left position")
     pose = current_board_cfg.get("left_pose")
     if pose: mc.send_angles(pose, robot_cfg["speed"])
+    return pose
 
 def go_right():
     if LOGGING_TOGGLE: logger.warning("Moving to right position")
     mc.send_angles(current_board_cfg["right_pose"], robot_cfg["speed"])
+    return current_board_cfg["right_pose"]
 
 def go_before_home():
     if LOGGING_TOGGLE: logger.warning("Moving to before home position")
     mc.send_angles(robot_cfg["before_home"], robot_cfg["speed"])
+    return robot_cfg["before_home"]
+
+
+# ---------- Motion Wait ----------
+motion_cfg = config.get("motion_wait", {})
+last_settle_sec = {}
+
+def wait_for_motion_done(target, tolerance=None, stable_samples=None, timeout=None, pass_through=False):
+    """Poll joint angles until the arm is within `tolerance` deg of `target` and has not moved
+    for `stable_samples` reads. Returns the measured settle time in seconds, or None on timeout.
+    With `pass_through` it returns as soon as the arm is near the target (for blending waypoints)."""
+    tolerance = motion_cfg.get("angle_tolerance_deg", 1.0) if tolerance is None else tolerance
+    stable_samples = motion_cfg.get("stable_samples", 3) if stable_samples is None else stable_samples
+    timeout = motion_cfg.get("timeout_sec", 5.0) if timeout is None else timeout
+    still_tol = motion_cfg.get("still_tolerance_deg", 0.2)
+    poll = motion_cfg.get("poll_interval_sec", 0.03)
+
+    t_start = time.monotonic()
+    stable = 0
+    last = None
+    while time.monotonic() - t_start < timeout:
+        angles = mc.get_angles()
+        # get_angles() returns -1 / None / short list on a serial hiccup
+        if isinstance(angles, list) and len(angles) == len(target):
+            near = all(abs(a - t) <= tolerance for a, t in zip(angles, target))
+            if near and pass_through:
+                return time.monotonic() - t_start
+            still = last is not None and all(abs(a - b) <= still_tol for a, b in zip(angles, last))
+            stable = stable + 1 if (near and still) else 0
+            last = angles
+            if stable >= stable_samples:
+                return time.monotonic() - t_start
+        time.sleep(poll)
+
+    if LOGGING_TOGGLE: logger.warning(f"Motion wait timed out after {timeout:.1f}s (last angles {last})")
+    return None
 
+def settle(name, pose, fallback_sec):
+    """Wait for the move to `pose` to finish; fixed sleep if motion wait is disabled. Returns settled time (monotonic)."""
+    if pose and motion_cfg.get("enabled", True):
+        settle_sec = wait_for_motion_done(pose)
+    else:
+        time.sleep(fallback_sec)
+        settle_sec = fallback_sec
+    last_settle_sec[name] = settle_sec
+    if LOGGING_TOGGLE:
+        shown = f"{settle_sec:.2f}s" if settle_sec is not None else "timeout"
+        logger.warning(f"{name}: settle time {shown}")
+    return time.monotonic()
+
+
+
+# ---------- Path Planner ----------
+planner_cfg = config.get("path_planner", {})
+# safe_envelope ships empty: it must come from clearances measured on the cell (one [min, max] per joint
+# inside which any pose is known to clear the fixture), not from the bounding box of the taught poses,
+# which would approve every leg.
+
+def segment_is_clear(start, goal):
+    """True if the straight joint-space move from `start` to `goal` stays inside path_planner.safe_envelope.
+    The envelope is a per-joint box, which is convex, so checking both endpoints covers the whole segment.
+    No envelope configured means nothing is known to be clear."""
+    envelope = planner_cfg.get("safe_envelope")
+    if not envelope or not start or not goal:
+        return False
+    return all(lo <= q <= hi for pose in (start, goal) for q, (lo, hi) in zip(pose, envelope))
+
+def plan_leg(start, goal, via):
+    """Waypoints for one leg: the fixed route through `via`, or straight to `goal` when the planner is
+    enabled and the direct segment is clear. The planner only ever drops waypoints, never adds them."""
+    if via is None or (planner_cfg.get("enabled", False) and segment_is_clear(start, goal)):
+        return [goal]
+    return [via, goal]
+
+def plan_cycle():
+    """Waypoint lists for the left, right and home legs of the current board."""
+    home = robot_cfg["home_pose"]
+    before_home = robot_cfg["before_home"]
+    left = current_board_cfg.get("left_pose")
+    right = current_board_cfg.get("right_pose")
+    legs = {
+        "left": plan_leg(home, left, None),
+        "right": plan_leg(left, right, before_home),
+        "home": plan_leg(right, home, before_home),
+    }
+    if LOGGING_TOGGLE:
+        moves = sum(len(leg) for leg in legs.values())
+        logger.warning(f"{current_board_name}: planned {moves} moves ({5 - moves} before_home waypoints skipped)")
+    return legs
+
+def move_through(waypoints):
+    """Send a multi-point move. Intermediate waypoints are blended: the next target is sent as soon as the
+    arm is within pass_tolerance_deg, without waiting for it to settle. Returns the final pose."""
+    pass_tol = planner_cfg.get("pass_tolerance_deg", 8.0)
+    for wp in waypoints[:-1]:
+        mc.send_angles(wp, robot_cfg["speed"])
+        if motion_cfg.get("enabled", True):
+            wait_for_motion_done(wp, tolerance=pass_tol, pass_through=True)
+    goal = waypoints[-1]
+    if goal:
+        mc.send_angles(goal, robot_cfg["speed"])
+    return goal
 
 
 # ---------- Main Process ----------
@@ -323,6 +832,9 @@ def run_cycle_old():
 
 
 def run_cycle(on_left_image=None, on_right_image=None):
+    """Two-sided cycle. Each frame is grabbed into memory and the arm moves on right away;
+    encode, save and decode submission overlap the motion (see last_timeline)."""
+    global last_timeline
 
     if mc is None:
         raise RuntimeError("Robot not initialized. Call init_robot() before run_cycle().")
@@ -331,55 +843,53 @@ def run_cycle(on_left_image=None, on_right_image=None):
             mc.power_on()
             if mc.get_basic_input(inputs_cfg["light_curtain_sensor_pin"]) == 0:
                 if mc.get_basic_input(inputs_cfg["horse_shoe_sensor_pin"]) == 0:
+
+                    timeline = last_timeline = CycleTimeline()
                     
                     tower_light_red_off()
                     tower_light_green_off()
                     light_on()
 
+                    legs = plan_cycle()
+
                     # Home position to start
                     go_home()
                     # time.sleep(0.1)
                         
                     # Move to left and capture image    
-                    go_left()
-                    time.sleep(1.5)
-
-                    left_image_path = capture_image("left")
-                    if on_left_image:
-                        try:
-                            on_left_image(left_image_path)
-                        except Exception as e:
-                            if LOGGING_TOGGLE:
-                                logger.warning("Left image callback failed: %s", e)
-                            else:
-                                print("[WARN] Left image callback failed:", e)
-
-                    go_before_home()    
-                    # time.sleep(0.1)
-                    
+                    with timeline.stage("move_left"):
+                        left_settled = settle("left", move_through(legs["left"]), 1.5)
+
+                    with timeline.stage("grab_left"):
+                        left_capture = capture_frame("left", settled_at=left_settled, timeline=timeline)
+                    left_dispatch = dispatch_image(on_left_image, left_capture, "left")
+
                     # Move to right and capture image
-                    go_right()
-                    time.sleep(2)
-
-                    right_image_path = capture_image("right")
-                    if on_right_image:
-                        try:
-                            on_right_image(right_image_path)
-                        except Exception as e:
-                            if LOGGING_TOGGLE:
-                                logger.warning("Right image callback failed: %s", e)
-                            else:
-                                print("[WARN] Right image callback failed:", e)
-
-                    go_before_home()
-                    # time.sleep(0.1)
+                    with timeline.stage("move_right"):
+                        right_settled = settle("right", move_through(legs["right"]), 2)
+
+                    with timeline.stage("grab_right"):
+                        right_capture = capture_frame("right", settled_at=right_settled, timeline=timeline)
+                    right_dispatch = dispatch_image(on_right_image, right_capture, "right")
 
                     # Turn off light and return home
-                    go_home()
+                    with timeline.stage("move_home"):
+                        move_through(legs["home"])
 
                     light_off()
+
+                    # Saves ran in the background while the arm moved
+                    with timeline.stage("wait_saves"):
+                        left_image_path = left_capture.wait_saved() if left_capture else None
+                        right_image_path = right_capture.wait_saved() if right_capture else None
+                        # Callers expect their callbacks to have run when the cycle returns
+                        for dispatched in (left_dispatch, right_dispatch):
+                            if dispatched:
+                                dispatched.result()
                     
-                    if LOGGING_TOGGLE: logger.warning("Cycle complete. Images saved: %s, %s", left_image_path, right_image_path)
+                    if LOGGING_TOGGLE:
+                        logger.warning("Cycle complete. Images saved: %s, %s", left_image_path, right_image_path)
+                        logger.warning("Cycle timeline:\n%s", timeline.summary())
 
 
                     return left_image_path, right_image_path
@@ -405,22 +915,18 @@ def run_cycle_one_side(on_left_image=None):
                 time.sleep(0.1)
 
                 # --- Move to left side & capture one image ---
-                go_left()
-                time.sleep(1)
-                left_image_path = capture_image("left")
-                if on_left_image:
-                    try:
-                        on_left_image(left_image_path)
-                    except Exception as e:
-                        if LOGGING_TOGGLE:
-                            logger.warning("Left image callback failed: %s", e)
-                        else:
-                            print("[WARN] Left image callback failed:", e)
+                left_settled = settle("left", go_left(), 1)
+                left_capture = capture_frame("left", settled_at=left_settled)
+                left_dispatch = dispatch_image(on_left_image, left_capture, "left")
 
                 # --- Return home ---
                 go_home()
                 light_off()
 
+                left_image_path = left_capture.wait_saved() if left_capture else None
+                if left_dispatch:
+                    left_dispatch.result()
+
                 if LOGGING_TOGGLE:
                     logger.warning("Single-side cycle complete. Image saved: %s", left_image_path)
 
@@ -8,9 +8,10 @@ import concurrent.futures
 from urllib import response
 from datetime import datetime
 from tkinter import ttk, messagebox
-import barcode_testing as decode
 import tkinter as tk
-from dynamsoft_server_code import process_barcode
+from barcode_decoder import BarcodeDecoder, RemoteDecoder, LocalDecoder, CascadeDecoder, TemplateTierDecoder, TierMemory
+from decode_cache import DecodeCache
+from serial_format import SerialRules
 
 TIMING_LOGS = True
 
@@ -199,6 +200,7 @@ class SerialLinkerApp(tk.Tk):
         self.cycle_latched = False
         self.operator_id = ""
         self._log_lock = threading.Lock()
+        self._redecode_lock = threading.Lock()
 
         self._build_login()
 
@@ -269,6 +271,8 @@ class SerialLinkerApp(tk.Tk):
 
         right = tk.Frame(header, bg="#262626")
         right.pack(side="right", padx=20)
+        tk.Button(right, text="RE-DECODE", bg="#0078d7", fg="white",
+                  font=("Segoe UI", 14, "bold"), width=10, command=self._start_redecode).pack(side="left", padx=6)
         tk.Button(right, text="LOGOUT", bg="#ffb400", fg="black",
                   font=("Segoe UI", 14, "bold"), width=10, command=self._build_login).pack(side="left", padx=6)
         tk.Button(right, text="EXIT", bg="#e81123", fg="white",
@@ -360,28 +364,28 @@ class SerialLinkerApp(tk.Tk):
         left_code = right_code = None
         msg = "check board type"
 
-        LOCAL_DECODE = False
-
         def decode_barcode(path, side):
             t_start = time.perf_counter()
             if not path:
                 return None, None, 0.0
-            try:
-                if LOCAL_DECODE:
-                    reader = decode.get_barcode_reader()
-                    results = decode.decode_file(reader, path)
-                    t_elapsed = time.perf_counter() - t_start
-                    return (results[0].barcode_text if results else None), None, t_elapsed
-                relative_path = path.replace("/mt/barcode_dropbox/","")
-                out_file = f"/tmp/barcode_{side}.txt"
-                code = process_barcode(relative_path, out_file, "templates/ReadDPM.json")
-                t_elapsed = time.perf_counter() - t_start
-                return code, None, t_elapsed
-            except Exception as e:
-                err = f"{'Local' if LOCAL_DECODE else 'Remote'} decode failed: {e}"
-                print("[ERROR]", err)
-                t_elapsed = time.perf_counter() - t_start
-                return None, err, t_elapsed
+            # Robot core hands over an in-memory CaptureResult; the file is written in the background
+            capture = path if hasattr(path, "wait_saved") else None
+            result = DECODER.decode(path, side, board=board_name)
+            if result.error:
+                print("[ERROR]", result.error)
+            if result.rejected:
+                # Misread caught by the board's serial format: fail fast, no MES round trip
+                print(f"[DECODE] {side} read {result.rejected!r} does not match the {board_name} serial format")
+                result.text = "-1"
+            if capture and capture.timeline:
+                capture.timeline.mark(f"decode_{side}", t_start)
+            if robot_core and capture and not result.error and result.source != "cache":
+                # Corner points (local and remote decodes) feed the per-board ROI learner
+                if result.ok and result.corners:
+                    robot_core.learn_roi(capture, result.corners)
+                elif not result.ok and not result.rejected:
+                    robot_core.learn_roi_miss(side)
+            return result.text, result.error, result.elapsed
 
         single_side, left_path, right_path = False, None, None
 
@@ -420,7 +424,7 @@ class SerialLinkerApp(tk.Tk):
             t_robot_end = time.perf_counter()
             self.after(0, self._stop_pulse)
 
-            if not LOCAL_DECODE and left_path:
+            if DECODER.strategy != "local" and left_path:
                 print("[INFO] Submitting images to remote barcode server...")
 
             if left_path and left_future is None:
@@ -534,6 +538,9 @@ class SerialLinkerApp(tk.Tk):
                 f"link_api={link_sec:.2f}s, "
                 f"total={total_sec:.2f}s"
             )
+            print("[TIMING] Decoders: " + DECODER.summary())
+            if robot_core and getattr(robot_core, "last_timeline", None):
+                print("[TIMING] Stage timeline:\n" + robot_core.last_timeline.summary())
 
 
 
@@ -893,6 +900,53 @@ class SerialLinkerApp(tk.Tk):
             return False, str(e)
 
 
+    # ---------- Re-decode Failed Images ----------                                                         SerialLinkerApp_Function_18
+    def _start_redecode(self):
+        if self._redecode_lock.locked():
+            messagebox.showinfo("Re-decode", "Re-decode of failed images is already running")
+            return
+
+        def _worker():
+            with self._redecode_lock:
+                try:
+                    total, read = self.redecode_failed_links()
+                    text = f"{read} of {total} failed images from today read"
+                except Exception as e:
+                    print("[ERROR] Re-decode failed:", e)
+                    text = f"Re-decode failed: {e}"
+            self.after(0, lambda: messagebox.showinfo("Re-decode", text))
+        threading.Thread(target=_worker, daemon=True).start()
+
+    def redecode_failed_links(self, day=None):
+        """Re-decode the failed_links images of `day` (default today) as one bulk job on the decode server.
+        Images already decoded (decode cache) are not sent again. Results go to logs/redecode_<day>.csv."""
+        base_dir = os.path.expanduser("/mt/barcode_dropbox/logs")
+        failed_dir = os.path.join(base_dir, "failed_links")
+        day = day or datetime.now()
+        stamp = day.strftime("%Y%m%d")
+        if not os.path.isdir(failed_dir):
+            return 0, 0
+        paths = sorted(os.path.join(failed_dir, name) for name in os.listdir(failed_dir)
+                       if name.startswith("FAIL_") and f"_{stamp}_" in name and name.endswith(".jpg"))
+        if not paths:
+            return 0, 0
+
+        print(f"[DECODE] Re-decoding {len(paths)} failed images from {day:%Y-%m-%d}")
+        results = DECODER.decode_batch(paths)
+        csv_path = os.path.join(base_dir, "logs", f"redecode_{day:%Y-%m-%d}.csv")
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Timestamp", "Image", "Serial", "Source", "Error"])
+            for path, result in zip(paths, results):
+                writer.writerow([ts, os.path.basename(path), result.text if result.ok else "N/A",
+                                 result.source, result.error or ""])
+        read = sum(1 for result in results if result.ok)
+        print(f"[DECODE] Re-decode: {read}/{len(paths)} read → {csv_path}; {DECODER.summary()}")
+        return len(paths), read
+
+
 # --------------------------------------------------
 # NETWORK SHARE MOUNTING
 # --------------------------------------------------
@@ -947,6 +1001,43 @@ CFG = load_config(CONFIG_PATH)
 SIMULATE = bool(CFG.get("simulate_linking", False))
 POLL_INTERVAL_SEC = CFG.get("POLL_INTERVAL_SEC", 2)
 MAX_POLL_ATTEMPTS = CFG.get("MAX_POLL_ATTEMPTS", 30)
+DECODE_SERVER = {"host": "10.40.17.62", "port": 9000, "framing": "close", "timeout": 30.0,
+                 "interval": 5.0, "failure_threshold": 3, "reset_timeout": 30.0}
+DECODE_SERVER.update(CFG.get("decode_server", {}))
+DECODER_CFG = CFG.get("decoder", {})
+# Per-board serial formats reject misreads inside the decoders (early exit in race / tiers)
+SERIAL_RULES = SerialRules.from_config(CFG)
+TIERS_CFG = DECODER_CFG.get("template_tiers", {})
+LOCAL_TEMPLATE = DECODER_CFG.get("local_template")
+if TIERS_CFG.get("enabled", False):
+    # Engines load the tiered template file; each tier is a template name inside it
+    LOCAL_TEMPLATE = TIERS_CFG.get("template", LOCAL_TEMPLATE)
+if DECODER_CFG.get("local_engine", "thread") == "process":
+    # Fork the decode workers now, before Tk and the robot threads start
+    from decode_engine import ProcessDecoder
+    LOCAL_DECODER = ProcessDecoder(DECODER_CFG.get("process_workers", 0), LOCAL_TEMPLATE)
+    LOCAL_DECODER.available()
+else:
+    LOCAL_DECODER = LocalDecoder(DECODER_CFG.get("local_workers", 2), LOCAL_TEMPLATE)
+if DECODER_CFG.get("cascade", {}).get("enabled", False):
+    # Half-res ROI -> full-res ROI -> full frame, each only on a miss
+    cascade_cfg = DECODER_CFG["cascade"]
+    LOCAL_DECODER = CascadeDecoder(LOCAL_DECODER, cascade_cfg.get("scale", 0.5),
+                                   cascade_cfg.get("tiers", CascadeDecoder.TIERS), SERIAL_RULES)
+if TIERS_CFG.get("enabled", False):
+    LOCAL_DECODER = TemplateTierDecoder(LOCAL_DECODER, TIERS_CFG.get("tiers", ["ReadDM_Fast", "ReadDPM_Basic", "ReadDPM"]),
+                                        TierMemory(TIERS_CFG.get("memory_path"), TIERS_CFG.get("history", 20)),
+                                        SERIAL_RULES)
+DECODE_CACHE = None
+if DECODER_CFG.get("cache", {}).get("enabled", False):
+    cache_cfg = DECODER_CFG["cache"]
+    DECODE_CACHE = DecodeCache(cache_cfg.get("max_entries", 256), cache_cfg.get("ttl_sec", 600.0),
+                               cache_cfg.get("path"), cache_cfg.get("save_interval_sec", 30.0))
+DECODER = BarcodeDecoder(DECODER_CFG.get("strategy", "remote"),
+                         remote=RemoteDecoder(**DECODE_SERVER),
+                         local=LOCAL_DECODER,
+                         cache=DECODE_CACHE,
+                         rules=SERIAL_RULES)
 
 
 # --------------------------------------------------